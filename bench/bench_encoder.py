@@ -0,0 +1,74 @@
+# Микробенчмарк кодировщика calldata и побайтовая сверка с эталонным build_submit_remote_order_data.
+#
+#   python bench/bench_encoder.py --cases 20000 --iterations 200000
+
+import argparse
+import os
+import random
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+os.environ.setdefault("PRIVATE_KEY_LOCAL", "0x" + "11" * 32)
+os.environ.setdefault("APIKEY", "bench")
+
+import main  # noqa: E402
+
+EDGE_AMOUNTS = (0, 1, 10**18, 2**255, 2**256 - 1)
+SENDERS = (main.SENDER_ADDRESS, "0x" + "00" * 20, "0x" + "ff" * 20, "0xAbCdEf0123456789aBcDeF0123456789AbCdEf01")
+TO_CHAINS = ("arbt", "opst", "bast", "unit")
+
+
+def reference(sender: str, to_chain: str, amount: int, reward: int) -> bytes:
+    return bytes.fromhex(main.build_submit_remote_order_data(sender, amount, reward, chain_id_hex=to_chain.encode().hex())[2:])
+
+
+def check_case(sender: str, to_chain: str, amount: int, reward: int):
+    # Явная проверка, а не assert: сверка запускается и из bench/smoke.py в CI, в том числе под python -O
+    encoded, expected = main.encode_order_calldata(sender, to_chain, amount, reward), reference(sender, to_chain, amount, reward)
+    if encoded != expected:
+        raise AssertionError(f"calldata расходится для {(sender, to_chain, amount, reward)}: {encoded.hex()} != {expected.hex()}")
+
+
+def check_equivalence(cases: int, rng: random.Random) -> int:
+    checked = 0
+    for sender in SENDERS:
+        for to_chain in TO_CHAINS:
+            for amount in EDGE_AMOUNTS:
+                for reward in EDGE_AMOUNTS:
+                    check_case(sender, to_chain, amount, reward)
+                    checked += 1
+    for _ in range(cases):
+        sender = rng.choice(SENDERS)
+        to_chain = rng.choice(TO_CHAINS)
+        amount = rng.getrandbits(rng.choice((64, 128, 256)))
+        reward = rng.getrandbits(rng.choice((64, 128, 256)))
+        check_case(sender, to_chain, amount, reward)
+        checked += 1
+    return checked
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(description="Микробенчмарк и сверка кодировщика calldata")
+    parser.add_argument("--cases", type=int, default=20000, help="случайных наборов для сверки")
+    parser.add_argument("--iterations", type=int, default=200000)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    checked = check_equivalence(args.cases, random.Random(args.seed))
+    print(f"equivalence: {checked} cases byte-for-byte identical")
+
+    sender, to_chain, amount, reward = main.SENDER_ADDRESS, "arbt", 989_123_456_789_000_000, 10**18
+    chain_id_hex = to_chain.encode().hex()
+    timings = {
+        "build_submit_remote_order_data (hex str)": lambda: main.build_submit_remote_order_data(sender, amount, reward, chain_id_hex=chain_id_hex),
+        "  + bytes.fromhex for signing": lambda: reference(sender, to_chain, amount, reward),
+        "encode_order_calldata (bytes)": lambda: main.encode_order_calldata(sender, to_chain, amount, reward),
+    }
+    for name, fn in timings.items():
+        per_call = timeit.timeit(fn, number=args.iterations) / args.iterations
+        print(f"{name:42s} {per_call * 1e9:8.0f} ns/call")
+
+
+if __name__ == "__main__":
+    main_cli()
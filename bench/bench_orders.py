@@ -0,0 +1,243 @@
+# Офлайн-бенчмарк пропускной способности main.py: выбор маршрута + send_remote_order_tx против
+# локальных заглушек RPC и t2rn. Сеть и ключ Alchemy не нужны. Синхронный режим гоняет сам run_sync_loop
+# (планировщик, слоты отправки сетей, окно пауз) с нулевой задержкой между ордерами.
+#
+#   python bench/bench_orders.py --orders 200 --latency-ms 30
+#   python bench/bench_orders.py --orders 100 --pause 1,2
+#   python bench/bench_orders.py --mode async --orders 400 --latency-ms 30 --error-rate 0.01
+
+import argparse
+import asyncio
+import io
+import os
+import random
+import statistics
+import sys
+import threading
+import time
+from datetime import datetime
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+os.environ.setdefault("PRIVATE_KEY_LOCAL", "0x" + "11" * 32)
+os.environ.setdefault("APIKEY", "bench")
+
+from mock_rpc import MockServices  # noqa: E402
+
+
+def load_main(base_urls: list, args, ws_base_url: str = None):
+    import main
+    from web3 import Web3
+
+    main.CONFIG.update({
+        "METRICS_PORT": 0,
+        "METRICS_SNAPSHOT_FILE": "",
+        "MAX_INFLIGHT_TX_PER_CHAIN": args.inflight,
+        "PRESIGN_ORDERS_PER_CHAIN": args.presign,
+        "RPC_HEDGE_READS": args.hedge,
+        "RPC_CU_PER_SEC": args.quota_cu if args.limit_cu is None else args.limit_cu,
+        "ADAPTIVE_INFLIGHT": not args.no_aimd,
+        "ORDER_SIZE_FROM_BALANCE": args.size_from_balance,
+        "DELAY_RANGE": (0, 0),  # замеряем отправку, а не задержку между ордерами
+    })
+    main.NONCE_MANAGER.max_inflight = args.inflight
+    for chain in main.RPCS:
+        urls = [f"{base_url}/{chain}" for base_url in base_urls]
+        if ws_base_url:
+            urls.append(f"{ws_base_url}/{chain}")
+        main.RPCS[chain] = urls[0] if len(urls) == 1 else urls
+        main.WEB3_INSTANCES[chain] = Web3(main.make_http_provider(chain))
+    main.ESTIMATE_URL = f"{base_urls[0]}/estimate"
+    return main
+
+
+SYNC_STALL_SEC = 60
+_sync_sends = []  # (time.time() начала, длительность, ok) каждой отправки из send_slot
+_sync_local = threading.local()
+
+
+def record_sends(main):
+    # send_slot вызывает broadcast_order / send_remote_order_tx по имени модуля — подменяем их замеряющими
+    # обёртками; broadcast_order внутри send_remote_order_tx второй раз не считается
+    for name in ("broadcast_order", "send_remote_order_tx"):
+        def timed(*args, send=getattr(main, name)):
+            if getattr(_sync_local, "sending", False):
+                return send(*args)
+            _sync_local.sending = True
+            started, started_perf = time.time(), time.perf_counter()
+            try:
+                ok = send(*args)
+            finally:
+                _sync_local.sending = False
+            _sync_sends.append((started, time.perf_counter() - started_perf, ok))
+            return ok
+        setattr(main, name, timed)
+
+
+def start_sync_loop(main, pause: tuple = None):
+    # Один run_sync_loop на процесс: и прогрев, и замер берут отправки из него
+    now = time.time()
+    pauses = [] if pause is None else [{"start": int(now + pause[0]), "duration": pause[1], "type": "pause"}]
+    schedule = {"date": datetime.utcnow().date().isoformat(), "pauses": pauses, "last_big_pause": int(now)}
+    record_sends(main)
+    threading.Thread(target=main.run_sync_loop, args=(schedule,), name="sync-loop", daemon=True).start()
+    return pauses
+
+
+def run_sync(main, orders: int) -> list:
+    first = len(_sync_sends)
+    last_progress = (first, time.time())
+    while len(_sync_sends) < first + orders:
+        if len(_sync_sends) != last_progress[0]:
+            last_progress = (len(_sync_sends), time.time())
+        elif time.time() - last_progress[1] > SYNC_STALL_SEC:
+            raise RuntimeError(f"run_sync_loop не отправляет ордера {SYNC_STALL_SEC} с: проверьте балансы заглушки")
+        time.sleep(0.01)
+    return [(duration, ok) for _, duration, ok in _sync_sends[first:first + orders]]
+
+
+def sends_in_pauses(pauses: list) -> int:
+    return sum(1 for started, _, _ in _sync_sends
+               for p in pauses if p["start"] <= started < p["start"] + p["duration"])
+
+
+async def run_async(main, orders: int) -> list:
+    import aiohttp
+    from web3 import AsyncWeb3
+
+    for chain in main.RPCS:
+        main.ASYNC_WEB3_INSTANCES[chain] = AsyncWeb3(main.make_async_http_provider(chain))
+    results = []
+
+    async def worker(source, session):
+        w3 = main.ASYNC_WEB3_INSTANCES[source]
+        while len(results) < orders:
+            started = time.perf_counter()
+            order = main.PRESIGNED_ORDERS.take(source)
+            if order is not None:
+                ok = await main.broadcast_order_async(w3, order)
+            else:
+                target = await main.select_target_async(source)
+                if target is None:
+                    await asyncio.sleep(0.05)
+                    continue
+                ok = await main.send_remote_order_tx_async(w3, session, source, target)
+            results.append((time.perf_counter() - started, ok))
+            if main.CONFIG["PRESIGN_ORDERS_PER_CHAIN"] > 0:
+                await main.presign_orders_async(w3, session, source)
+
+    async with aiohttp.ClientSession() as session:
+        background = [asyncio.ensure_future(main.async_receipt_poller()),
+                      asyncio.ensure_future(main.async_estimate_refresher(session)),
+                      asyncio.ensure_future(main.async_balance_refresher())]
+        background += [asyncio.ensure_future(main.watch_new_heads(chain, main.on_new_head_async))
+                       for chain in main.head_chains()]
+        await asyncio.gather(*(worker(source, session) for source in main.get_all_sources()))
+        for task in background:
+            task.cancel()
+    for w3 in main.ASYNC_WEB3_INSTANCES.values():
+        await w3.provider.disconnect()
+    return results[:orders]
+
+
+def percentile(values: list, pct: float) -> float:
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def order_outcomes(main) -> dict:
+    outcomes = {}
+    for counter in main.METRICS.snapshot()["counters"]:
+        if counter["name"].startswith("anyarb_orders_"):
+            outcome = counter["name"][len("anyarb_orders_"):-len("_total")]
+            outcomes[outcome] = outcomes.get(outcome, 0) + counter["value"]
+    return outcomes
+
+
+def report(args, main, services: MockServices, results: list, elapsed: float, out=sys.__stdout__):
+    latencies = [duration * 1000 for duration, _ in results]
+    sent = sum(1 for _, ok in results if ok)
+    total = len(results)
+    print(f"mode={args.mode} orders={total} latency_ms={args.latency_ms} error_rate={args.error_rate}"
+          f" block_time={args.block_time} inflight={args.inflight}", file=out)
+    print("  outcomes:        " + ", ".join(f"{k}={v}" for k, v in sorted(order_outcomes(main).items())), file=out)
+    print(f"  throughput:      {total / elapsed:8.2f} orders/s ({sent / elapsed:.2f} sent/s)", file=out)
+    print(f"  order latency:   p50 {percentile(latencies, 50):7.1f} ms   p99 {percentile(latencies, 99):7.1f} ms"
+          f"   mean {statistics.mean(latencies):7.1f} ms", file=out)
+    print(f"  rpc calls/order: {services.total_rpc_calls() / total:8.2f}"
+          f"   http requests/order: {services.http_requests / total:.2f}"
+          f"   estimate calls: {services.estimate_calls}   throttled (429): {services.throttled}", file=out)
+    for method, count in sorted(services.rpc_calls.items()):
+        print(f"    {method:28s} {count / total:6.2f}", file=out)
+    for chain, pool in sorted(main.RPC_POOLS.items()):
+        for endpoint in pool.endpoints:
+            latency = f"{endpoint.latency * 1000:7.1f} ms" if endpoint.latency is not None else "      —   "
+            print(f"  pool {chain} {endpoint.url}: latency {latency}  error_rate {endpoint.error_rate:.2f}", file=out)
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(description="Офлайн-бенчмарк отправки ордеров main.py")
+    parser.add_argument("--mode", choices=("sync", "async"), default="sync")
+    parser.add_argument("--orders", type=int, default=200)
+    parser.add_argument("--warmup", type=int, default=10, help="ордеров до начала замера")
+    parser.add_argument("--latency-ms", type=float, default=20)
+    parser.add_argument("--jitter-ms", type=float, default=5)
+    parser.add_argument("--estimate-latency-ms", type=float, default=80)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--block-time", type=float, default=0.5)
+    parser.add_argument("--inflight", type=int, default=8)
+    parser.add_argument("--reject-batch", action="store_true")
+    parser.add_argument("--endpoints", type=int, default=1, help="RPC endpoint'ов на сеть (пул)")
+    parser.add_argument("--slow-endpoint-ms", type=float, default=None, help="задержка первого endpoint'а пула")
+    parser.add_argument("--down-endpoint", action="store_true", help="первый endpoint пула отвечает 503")
+    parser.add_argument("--ws", action="store_true", help="newHeads по WebSocket вместо опроса")
+    parser.add_argument("--hedge", action="store_true", help="RPC_HEDGE_READS")
+    parser.add_argument("--quota-cu", type=float, default=0, help="квота заглушки, CU/сек на все сети (0 — без квоты)")
+    parser.add_argument("--limit-cu", type=float, default=None, help="RPC_CU_PER_SEC в main.py (по умолчанию = --quota-cu)")
+    parser.add_argument("--no-aimd", action="store_true", help="ADAPTIVE_INFLIGHT = False")
+    parser.add_argument("--size-from-balance", action="store_true", help="ORDER_SIZE_FROM_BALANCE")
+    parser.add_argument("--presign", type=int, default=0, help="PRESIGN_ORDERS_PER_CHAIN")
+    parser.add_argument("--pause", default=None,
+                        help="sync: окно паузы 'START,DURATION' в секундах от старта цикла; отправка в нём — ошибка")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--verbose", action="store_true", help="не глушить вывод main.py")
+    args = parser.parse_args()
+    random.seed(args.seed)
+
+    services = MockServices(latency_ms=args.latency_ms, jitter_ms=args.jitter_ms, error_rate=args.error_rate,
+                            estimate_latency_ms=args.estimate_latency_ms, block_time=args.block_time,
+                            reject_batch=args.reject_batch, quota_cu_per_sec=args.quota_cu)
+    base_urls = [services.start() for _ in range(args.endpoints)]
+    if args.slow_endpoint_ms is not None:
+        services.endpoints[0]["latency_ms"] = args.slow_endpoint_ms
+    if args.down_endpoint:
+        services.endpoints[0]["http_status"] = 503
+    ws_base_url = services.start_ws() if args.ws else None
+    if not args.verbose:
+        # Фоновые потоки main.py продолжают писать и после замера — глушим stdout целиком
+        sys.stdout = io.StringIO()
+    pauses = []
+    try:
+        main = load_main(base_urls, args, ws_base_url)
+        if args.mode == "sync":
+            pauses = start_sync_loop(main, tuple(map(float, args.pause.split(","))) if args.pause else None)
+        runner = run_sync if args.mode == "sync" else (lambda m, n: asyncio.run(run_async(m, n)))
+        if args.warmup:
+            runner(main, args.warmup)
+        services.reset_counters()
+        main.METRICS = main.Metrics()
+        started = time.perf_counter()
+        results = runner(main, args.orders)
+        elapsed = time.perf_counter() - started
+    finally:
+        services.stop()
+    report(args, main, services, results, elapsed)
+    if pauses:
+        in_pause = sends_in_pauses(pauses)
+        print(f"  sends in pause:  {in_pause}", file=sys.__stdout__)
+        if in_pause:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main_cli()
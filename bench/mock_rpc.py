@@ -0,0 +1,316 @@
+# Локальные заглушки для бенчмарка: JSON-RPC нод (по сети на путь /<chain>) и /estimate как у api.t2rn.io.
+# Задержка и доля ошибок настраиваются, счётчики вызовов читаются драйвером. Каждый start() поднимает ещё
+# один endpoint над тем же состоянием сетей — так проверяется пул RPC (свои задержка и HTTP-статус у endpoint'а).
+
+import asyncio
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from eth_account.typed_transactions import TypedTransaction
+from eth_utils import keccak
+from hexbytes import HexBytes
+from websockets.asyncio.server import serve
+
+CHAIN_IDS = {'opst': 11155420, 'bast': 84532, 'unit': 1301, 'arbt': 421614}
+# Стоимость методов в compute units, как у Alchemy: квота заглушки считается в них
+METHOD_CU = {"eth_chainId": 0, "eth_blockNumber": 10, "eth_feeHistory": 10, "eth_getTransactionReceipt": 15,
+             "eth_getBalance": 19, "eth_estimateGas": 20, "eth_call": 26, "eth_getTransactionCount": 26,
+             "eth_sendRawTransaction": 40}
+
+
+class MockChainState:
+    # Mempool по nonce: TX майнится по порядку nonce, не раньше block_time после отправки и только если
+    # maxFeePerGas покрывает текущий base fee. Замена TX с тем же nonce требует +10% к fee, как в geth.
+    def __init__(self, chain_id: int, block_time: float, balance_wei: int):
+        self.chain_id = chain_id
+        self.block_time = block_time
+        self.balance_wei = balance_wei
+        self.base_fee = 10**9
+        self.started = time.time()
+        self.lock = threading.Lock()
+        self.sent = {}  # tx_hash -> {"nonce", "max_fee", "priority_fee", "sent_at", "block"}
+        self.pool = {}  # nonce -> tx_hash, ещё не замайненные
+        self.mined = 0  # замайненных nonce (= getTransactionCount latest)
+
+    def block_number(self) -> int:
+        return int((time.time() - self.started) / self.block_time) + 1
+
+    def mine(self):
+        # Вызывается под self.lock
+        now = time.time()
+        while self.mined in self.pool:
+            tx = self.sent[self.pool[self.mined]]
+            if tx["max_fee"] < self.base_fee or now - tx["sent_at"] < self.block_time:
+                break
+            tx["block"] = self.block_number()
+            del self.pool[self.mined]
+            self.mined += 1
+
+    def counts(self) -> tuple:
+        with self.lock:
+            self.mine()
+            return self.mined, (max(self.pool) + 1 if self.pool else self.mined)
+
+    def submit(self, raw_tx: str) -> tuple:
+        # -> (tx_hash, None) или (None, сообщение об ошибке)
+        tx_hash = "0x" + keccak(hexstr=raw_tx).hex()
+        tx = TypedTransaction.from_bytes(HexBytes(raw_tx)).as_dict()
+        with self.lock:
+            self.mine()
+            if tx_hash in self.sent:
+                return None, "already known"
+            if tx["nonce"] < self.mined:
+                return None, "nonce too low"
+            replaced = self.pool.get(tx["nonce"])
+            if replaced is not None:
+                old = self.sent[replaced]
+                if tx["maxFeePerGas"] * 10 < old["max_fee"] * 11 or tx["maxPriorityFeePerGas"] * 10 < old["priority_fee"] * 11:
+                    return None, "replacement transaction underpriced"
+            self.pool[tx["nonce"]] = tx_hash
+            self.sent[tx_hash] = {"nonce": tx["nonce"], "max_fee": tx["maxFeePerGas"],
+                                  "priority_fee": tx["maxPriorityFeePerGas"], "sent_at": time.time(), "block": None}
+        return tx_hash, None
+
+    def receipt_block(self, tx_hash: str):
+        with self.lock:
+            self.mine()
+            tx = self.sent.get(tx_hash)
+            return tx["block"] if tx else None
+
+
+class MockServices:
+    def __init__(self, latency_ms: float = 0, jitter_ms: float = 0, error_rate: float = 0,
+                 estimate_latency_ms: float = 0, block_time: float = 2, balance_eth: int = 1000,
+                 reject_batch: bool = False, quota_cu_per_sec: float = 0):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+        self.estimate_latency_ms = estimate_latency_ms
+        self.reject_batch = reject_batch
+        self.quota_cu_per_sec = quota_cu_per_sec
+        self.call_reverts = {}  # chain -> revert data, с которой eth_call/eth_estimateGas откатываются
+        self.throttled = 0
+        self._quota_window = (0, 0)  # (секунда, потрачено CU)
+        self.chains = {name: MockChainState(cid, block_time, balance_eth * 10**18) for name, cid in CHAIN_IDS.items()}
+        self._lock = threading.Lock()
+        self.http_requests = 0
+        self.rpc_calls = {}
+        self.estimate_calls = 0
+        self.endpoints = []  # настройки endpoint'ов: {"url", "latency_ms", "http_status"}, можно менять на ходу
+        self._servers = []
+        self._ws_loop = None
+
+    # -- учёт -- #
+
+    def reset_counters(self):
+        with self._lock:
+            self.http_requests = 0
+            self.rpc_calls = {}
+            self.estimate_calls = 0
+            self.throttled = 0
+
+    def _over_quota(self, body) -> bool:
+        # Окно в одну секунду на все сети сразу — как квота на API-ключ
+        if self.quota_cu_per_sec <= 0:
+            return False
+        cost = sum(METHOD_CU.get(r.get("method"), 26) for r in (body if isinstance(body, list) else [body]))
+        second = int(time.time())
+        with self._lock:
+            window, spent = self._quota_window
+            if window != second:
+                spent = 0
+            if spent + cost > self.quota_cu_per_sec:
+                self._quota_window = (second, spent)
+                self.throttled += 1
+                return True
+            self._quota_window = (second, spent + cost)
+            return False
+
+    def total_rpc_calls(self) -> int:
+        with self._lock:
+            return sum(self.rpc_calls.values())
+
+    def _count(self, method: str):
+        with self._lock:
+            self.rpc_calls[method] = self.rpc_calls.get(method, 0) + 1
+
+    def _sleep(self, latency_ms: float):
+        delay = latency_ms + random.uniform(-self.jitter_ms, self.jitter_ms)
+        if delay > 0:
+            time.sleep(delay / 1000)
+
+    # -- JSON-RPC -- #
+
+    def handle_rpc(self, chain: str, request: dict) -> dict:
+        method = request.get("method")
+        params = request.get("params") or []
+        self._count(method)
+        response = {"jsonrpc": "2.0", "id": request.get("id")}
+        if random.random() < self.error_rate:
+            response["error"] = {"code": -32000, "message": "mock: internal error"}
+            return response
+        state = self.chains[chain]
+        if method == "eth_chainId":
+            result = hex(state.chain_id)
+        elif method == "eth_blockNumber":
+            result = hex(state.block_number())
+        elif method == "eth_getBalance":
+            result = hex(state.balance_wei)
+        elif method == "eth_getTransactionCount":
+            latest, pending = state.counts()
+            result = hex(pending if params[1:] == ["pending"] else latest)
+        elif method == "eth_feeHistory":
+            block = state.block_number()
+            result = {"oldestBlock": hex(block), "baseFeePerGas": [hex(state.base_fee), hex(state.base_fee)],
+                      "gasUsedRatio": [0.5], "reward": [[hex(10**6)]]}
+        elif method in ("eth_estimateGas", "eth_call") and chain in self.call_reverts:
+            response["error"] = {"code": 3, "message": "execution reverted", "data": self.call_reverts[chain]}
+            return response
+        elif method == "eth_estimateGas":
+            result = hex(95_000)
+        elif method == "eth_call":
+            result = "0x"
+        elif method == "eth_sendRawTransaction":
+            result, error = state.submit(params[0])
+            if error:
+                response["error"] = {"code": -32000, "message": error}
+                return response
+        elif method == "eth_getTransactionReceipt":
+            block = state.receipt_block(params[0])
+            if block is None:
+                result = None
+            else:
+                result = {"transactionHash": params[0], "status": "0x1", "gasUsed": hex(90_000), "blockNumber": hex(block)}
+        else:
+            response["error"] = {"code": -32601, "message": f"mock: method {method} not supported"}
+            return response
+        response["result"] = result
+        return response
+
+    def handle_estimate(self, payload: dict) -> dict:
+        with self._lock:
+            self.estimate_calls += 1
+        amount = int(payload["amountWei"])
+        received = amount * 99 // 100 - 3 * 10**14
+        return {"estimatedReceivedAmountWei": {"hex": hex(received)}}
+
+    # -- HTTP -- #
+
+    def start(self, port: int = 0, latency_ms: float = None, http_status: int = 200) -> str:
+        services = self
+        endpoint = {"latency_ms": self.latency_ms if latency_ms is None else latency_ms, "http_status": http_status}
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_POST(self):
+                body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+                with services._lock:
+                    services.http_requests += 1
+                path = self.path.strip("/")
+                if path == "estimate":
+                    services._sleep(services.estimate_latency_ms)
+                    out = services.handle_estimate(body)
+                elif path in services.chains:
+                    services._sleep(endpoint["latency_ms"])
+                    if endpoint["http_status"] != 200:
+                        self.send_error(endpoint["http_status"])
+                        return
+                    if services._over_quota(body):
+                        self.send_response(429)
+                        self.send_header("Retry-After", "1")
+                        self.send_header("Content-Length", "0")
+                        self.end_headers()
+                        return
+                    if isinstance(body, list):
+                        if services.reject_batch:
+                            out = {"jsonrpc": "2.0", "id": None, "error": {"code": -32600, "message": "mock: batch not supported"}}
+                        else:
+                            out = [services.handle_rpc(path, r) for r in body]
+                    else:
+                        out = services.handle_rpc(path, body)
+                else:
+                    self.send_error(404)
+                    return
+                data = json.dumps(out).encode()
+                try:
+                    self.send_response(200)
+                    self.send_header("Content-Type", "application/json")
+                    self.send_header("Content-Length", str(len(data)))
+                    self.end_headers()
+                    self.wfile.write(data)
+                except (BrokenPipeError, ConnectionResetError):
+                    pass  # клиент ушёл: проигравший дублирующий запрос или конец замера
+
+            def log_message(self, format, *args):
+                pass
+
+        server = ThreadingHTTPServer(("127.0.0.1", port), Handler)
+        server.daemon_threads = True
+        threading.Thread(target=server.serve_forever, name="mock-rpc", daemon=True).start()
+        self._servers.append(server)
+        endpoint["url"] = f"http://127.0.0.1:{server.server_address[1]}"
+        self.endpoints.append(endpoint)
+        return endpoint["url"]
+
+    # -- WebSocket (eth_subscribe newHeads) -- #
+
+    def head(self, chain: str, number: int) -> dict:
+        state = self.chains[chain]
+        return {"number": hex(number), "hash": "0x" + keccak(text=f"{chain}:{number}").hex(),
+                "parentHash": "0x" + keccak(text=f"{chain}:{number - 1}").hex(),
+                "timestamp": hex(int(state.started + number * state.block_time)), "baseFeePerGas": hex(state.base_fee)}
+
+    async def _push_heads(self, connection, chain: str, subscription: str):
+        state = self.chains[chain]
+        last = 0
+        while True:
+            number = state.block_number()
+            if number != last:
+                last = number
+                await connection.send(json.dumps({"jsonrpc": "2.0", "method": "eth_subscription",
+                                                  "params": {"subscription": subscription, "result": self.head(chain, number)}}))
+            await asyncio.sleep(state.block_time / 4)
+
+    async def _handle_ws(self, connection):
+        chain = connection.request.path.strip("/")
+        pushers = []
+        try:
+            async for message in connection:
+                request = json.loads(message)
+                if request.get("method") == "eth_subscribe":
+                    self._count("eth_subscribe")
+                    subscription = hex(random.getrandbits(64))
+                    await connection.send(json.dumps({"jsonrpc": "2.0", "id": request["id"], "result": subscription}))
+                    pushers.append(asyncio.ensure_future(self._push_heads(connection, chain, subscription)))
+                else:
+                    await connection.send(json.dumps(self.handle_rpc(chain, request)))
+        except Exception:
+            pass  # клиент отключился
+        finally:
+            for pusher in pushers:
+                pusher.cancel()
+
+    def start_ws(self, port: int = 0) -> str:
+        ready = threading.Event()
+        address = {}
+
+        async def run():
+            async with serve(self._handle_ws, "127.0.0.1", port) as server:
+                address["port"] = server.sockets[0].getsockname()[1]
+                ready.set()
+                await asyncio.get_running_loop().create_future()
+
+        self._ws_loop = asyncio.new_event_loop()
+        threading.Thread(target=self._ws_loop.run_until_complete, args=(run(),), name="mock-ws", daemon=True).start()
+        ready.wait()
+        return f"ws://127.0.0.1:{address['port']}"
+
+    def stop(self):
+        for server in self._servers:
+            server.shutdown()
+            server.server_close()
+        self._servers = []
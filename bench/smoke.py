@@ -0,0 +1,80 @@
+# Смоук-прогон для CI: команды бенчмарка из README на коротком числе ордеров и точечные проверки
+# main.py без сети. Падает (код 1), если бенчмарк завершился ошибкой, не отправил ни одного ордера
+# или проверка не прошла.
+#
+#   python bench/smoke.py
+
+import os
+import random
+import subprocess
+import sys
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(BENCH_DIR, ".."))
+os.environ.setdefault("PRIVATE_KEY_LOCAL", "0x" + "11" * 32)
+os.environ.setdefault("APIKEY", "bench")
+
+BENCH_RUNS = (
+    ["--orders", "30"],
+    ["--orders", "30", "--reject-batch"],  # -32600 на batch → переход на одиночные запросы
+    ["--orders", "200", "--presign", "2"],  # presign_orders(limit, source) в executor'е сети после отправки
+    ["--orders", "100", "--pause", "1,2"],  # окно паузы не задерживается слотами отправки
+    ["--mode", "async", "--orders", "60", "--presign", "2"],
+    ["--mode", "async", "--orders", "60", "--endpoints", "3", "--down-endpoint", "--hedge"],
+)
+
+
+def run_bench(args: list) -> bool:
+    cmd = [sys.executable, os.path.join(BENCH_DIR, "bench_orders.py"), "--warmup", "5", *args]
+    result = subprocess.run(cmd, capture_output=True, text=True, timeout=300)
+    ok = result.returncode == 0 and "sent=" in result.stdout
+    print(f"{'ok  ' if ok else 'FAIL'} bench_orders.py {' '.join(args)}")
+    if not ok:
+        print(result.stdout[-2000:] + result.stderr[-4000:])
+    return ok
+
+
+def check_nonce_claim():
+    from main import NonceManager
+
+    nonces = NonceManager(8)
+    nonces.seed("bast", 10, 10)
+    held, released, sent = nonces.allocate("bast"), nonces.allocate("bast"), nonces.allocate("bast")
+    nonces.release("bast", released)
+    assert not nonces.claim("bast", held), "nonce, который держит воркер, не должен отдаваться заглушке"
+    assert nonces.claim("bast", released), "возвращённый в пул nonce должен забираться"
+    assert not nonces.claim("bast", released), "nonce нельзя забрать дважды"
+    assert not nonces.claim("bast", sent)
+    nonces.mark_dropped("bast", sent)
+    assert nonces.claim("bast", sent), "nonce потерянной TX должен забираться"
+    assert not nonces.claim("bast", 9) and not nonces.claim("bast", 13), "вне [confirmed, next) — не наш"
+
+
+def check_calldata_equivalence():
+    # OrderCalldataTemplate против build_submit_remote_order_data: граничные суммы и случайные наборы
+    from bench_encoder import check_equivalence
+
+    check_equivalence(2000, random.Random(1))
+
+
+CHECKS = (check_nonce_claim, check_calldata_equivalence)
+
+
+def run_check(check) -> bool:
+    try:
+        check()
+    except Exception as e:
+        print(f"FAIL {check.__name__}: {type(e).__name__}: {e}")
+        return False
+    print(f"ok   {check.__name__}")
+    return True
+
+
+def main() -> int:
+    results = [run_check(check) for check in CHECKS]
+    results += [run_bench(args) for args in BENCH_RUNS]
+    return 0 if all(results) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
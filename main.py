@@ -1,9 +1,28 @@
+import asyncio
+import atexit
+import bisect
+import heapq
 import os
 import random
+import sqlite3
+import sys
+import threading
 import time
+import aiohttp
 import requests
+from collections import deque
+from queue import Empty, Queue
+from concurrent.futures import ThreadPoolExecutor, as_completed, wait
 from datetime import datetime, timedelta
-from web3 import Web3
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse
+from eth_account import Account
+from eth_abi import decode as abi_decode
+from web3 import AsyncWeb3, Web3, WebSocketProvider
+from web3.exceptions import BadResponseFormat, ContractLogicError, Web3RPCError
+from web3.providers.async_base import AsyncJSONBaseProvider
+from web3.providers.base import JSONBaseProvider
+from web3.providers.rpc.utils import ExceptionRetryConfiguration
 import json
 
 # ------------------- CONFIG ----------------------
@@ -21,10 +40,72 @@ CONFIG = {
     "SUCCESS_DELAY_MULTIPLIER": 1,
     "FAILURE_DELAY_MULTIPLIER": 0.1,
     "BALANCE_CHECK_EVERY_SUCCESS_TX": 10,
+    "ROUTE_PLANNER": True,  # детерминированный план маршрутов вместо случайного выбора source/target
+    "PLANNER_HORIZON_ORDERS": 50,  # на сколько ордеров вперёд строится план
+    "PLANNER_REPLAN_DELTA_ETH": 2,  # перестроить план, если баланс разошёлся с прогнозом сильнее
+    "MAX_INFLIGHT_TX_PER_CHAIN": 4,  # сколько неподтверждённых nonce допускается на одну сеть (старт для AIMD)
+    "ADAPTIVE_INFLIGHT": True,  # AIMD: растим лимит неподтверждённых TX, пока провайдер не начнёт троттлить
+    "ADAPTIVE_INFLIGHT_MAX": 16,
+    "ASYNC_MODE": False,  # True — асинхронный движок: свой воркер на каждую source-сеть
+    "STARTUP_TIMEOUT_SEC": 60,  # сколько ждать первую прогретую source-сеть перед основным циклом
+    "STARTUP_RETRY_MAX_SEC": 60,  # повтор прогрева недоступной сети с удвоением паузы до этого предела
+    "BALANCE_TTL_SEC": 30,  # сколько живёт снимок баланса сети
+    "BALANCE_REFRESH_INTERVAL_SEC": 20,  # период фонового обновления балансов (0 — только по TTL)
+    "FEE_CACHE_TTL_SEC": 2,  # сколько секунд base fee блока считается актуальным (~время блока)
+    "GAS_LIMIT_WINDOW": 10,  # по скольким последним estimate_gas маршрута берётся максимум
+    "SIMULATION_AMOUNT_BUCKET_ETH": 0.01,  # ордера маршрута с суммой в одной корзине делят симуляцию блока
+    "SIMULATION_CACHE_TTL_SEC": 2,  # не дольше этого, даже если номер блока не обновлялся (~время блока)
+    "RECEIPT_POLL_INTERVAL_SEC": 3,  # как часто опрашивать receipts отправленных TX
+    "RECEIPT_TIMEOUT_SEC": 600,  # после этого TX без receipt перестаёт отслеживаться
+    "RPC_HEDGE_READS": False,  # дублировать чтения на два самых быстрых endpoint'а и брать первый ответ
+    "RPC_HEDGE_DELAY_MS": 0,  # второй (дублирующий) запрос уходит, если первый не ответил за это время
+    "RPC_QUARANTINE_BASE_SEC": 5,  # карантин endpoint'а после ошибки, удваивается при повторных
+    "RPC_QUARANTINE_MAX_SEC": 300,
+    "WS_HEAD_STALE_SEC": 30,  # без newHeads дольше этого сеть возвращается к опросу по HTTP
+    "WS_STATE_REFRESH_MIN_SEC": 2,  # балансы/receipts по новому блоку — не чаще раза в столько секунд на сеть
+    "WS_RECONNECT_MAX_SEC": 60,
+    "RPC_CU_PER_SEC": 500,  # квота провайдера на один API-ключ, compute units/сек (0 — без лимита)
+    "RPC_CU_BURST": 1000,
+    "ESTIMATE_RPS": 5,  # лимит запросов к api.t2rn.io (0 — без лимита)
+    "ESTIMATE_BURST": 10,
+    "THROTTLE_RETRIES": 2,  # повторов RPC после 429 (после паузы лимитера)
+    "THROTTLE_BACKOFF_SEC": 1,  # пауза после 429, если провайдер не прислал Retry-After
+    "STUCK_CHECK_INTERVAL_SEC": 15,  # период проверки зависших TX и дыр в nonce
+    "STUCK_AFTER_BLOCKS": 20,  # TX без receipt дольше стольких блоков переподписывается с большим fee
+    "REPLACEMENT_BUMP_PERCENT": 12,  # прибавка fee при замене (узлы требуют не меньше 10%)
+    "STUCK_MAX_FEE_GWEI": 50,  # выше этого maxFeePerGas не поднимаем — TX остаётся ждать
+    "BREAKER_FAILURE_THRESHOLD": 3,  # столько persistent-ревертов подряд выводят маршрут из ротации
+    "BREAKER_COOLDOWN_SEC": 600,  # на сколько; потом одна пробная попытка
+    "BREAKER_MAX_COOLDOWN_SEC": 3600,  # неудачная проба удваивает паузу до этого предела
+    "SIGNING_WORKERS": 2,  # потоки для подписи TX (ECDSA не держит event loop)
+    "PRESIGN_ORDERS_PER_CHAIN": 0,  # сколько ордеров готовить и подписывать заранее на сеть (0 — выключено)
+    "PRESIGN_MAX_AGE_SEC": 30,  # заранее подписанный ордер старше этого выбрасывается
+
+    # --- Лог событий ---
+    "LOG_LEVEL": "info",  # debug | info | warning | error
+    "LOG_FORMAT": "console",  # console — человекочитаемо, jsonl — по JSON-объекту на строку
+    "LOG_FILE": "",  # "" — stdout
+    "LOG_BUFFER_EVENTS": 10000,  # очередь полна — debug-события отбрасываются, отправка не ждёт вывода
+
+    # --- Метрики ---
+    "JOURNAL_FILE": "orders_journal.sqlite3",  # SQLite-журнал ордеров и estimate ("" — выключен)
+    "JOURNAL_RETENTION_DAYS": 7,  # завершённые ордера старше этого удаляются при старте
+    "METRICS_PORT": 9105,  # Prometheus-эндпоинт http://127.0.0.1:PORT/metrics (0 — выключен)
+    "METRICS_SNAPSHOT_FILE": "metrics_snapshot.json",  # периодический JSON-снимок ("" — выключен)
+    "METRICS_SNAPSHOT_INTERVAL_SEC": 60,
 
     # Новый блок настроек запроса к t2rn
     "ESTIMATE_REFRESH_INTERVAL_RANGE_SEC": (180, 300),  # (3, 5) минут
     "ESTIMATE_FLUCTUATION_PERCENT_RANGE": (0.0000011, 0.0000015),  # ±0.01%–0.011%
+    "ESTIMATE_BACKGROUND_REFRESH": True,  # держать все маршруты тёплыми в фоне, ордер берёт значение из кэша
+    "QUOTE_GRID_ETH": (0.5, 1, 2, 4),  # суммы, по которым снимается кривая estimate маршрута (1 ETH — всегда)
+    "QUOTE_MAX_ERROR_PERCENT": 0.05,  # кривая дальше от прямой "спред + комиссия" — котировка только из API
+
+    # --- Размер ордера ---
+    "ORDER_SIZE_FROM_BALANCE": False,  # False — всегда 1 ETH
+    "ORDER_BALANCE_FRACTION": 0.05,  # доля баланса source-сети на один ордер
+    "ORDER_MIN_ETH": 0.5,  # меньше — ордер не отправляется
+    "ORDER_MAX_ETH": 4,  # больше сетки QUOTE_GRID_ETH — каждая котировка будет отдельным запросом к API
 
     # --- Паузы ---
     "PAUSE_FILE": "pauses_schedule.txt",
@@ -50,6 +131,8 @@ if not PRIVATE_KEY:
 if not APIKEY:
     raise Exception('APIKEY is missing in environment!')
 
+# Значение — URL или список URL (пул endpoint'ов, см. RPC POOL). ws:// / wss:// в списке — подписка на
+# newHeads (см. NEW HEADS), HTTP-запросы по нему не ходят
 RPCS = {
     'opst': f'https://opt-sepolia.g.alchemy.com/v2/{APIKEY}',
     'bast': f'https://base-sepolia.g.alchemy.com/v2/{APIKEY}',
@@ -63,60 +146,1283 @@ TO_ADDRESSES = {
     'unit': '0x1cEAb5967E5f078Fa0FEC3DFfD0394Af1fEeBCC9',
 }
 
-WEB3_INSTANCES = {name: Web3(Web3.HTTPProvider(url)) for name, url in RPCS.items()}
-w3_example = next(iter(WEB3_INSTANCES.values()))
-SENDER_ADDRESS = w3_example.eth.account.from_key(PRIVATE_KEY).address
-print(f'👤 Sender address: {SENDER_ADDRESS}')
+# eth_chainId кэшируется провайдером: web3 дёргает его при валидации каждой TX
+RPC_CACHEABLE_REQUESTS = {"eth_chainId"}
+
+# ------------------- RATE LIMITS ----------------------
+# Все сети ходят через один APIKEY, поэтому лимитер общий на ключ: token bucket в compute units, каждый
+# метод стоит столько, сколько за него списывает провайдер. На 429 bucket опустошается до Retry-After,
+# запрос повторяется после паузы, а AIMD урезает число неподтверждённых TX. api.t2rn.io — свой лимитер.
+
+RPC_METHOD_COST = {  # compute units Alchemy
+    "eth_chainId": 0,
+    "eth_blockNumber": 10,
+    "eth_feeHistory": 10,
+    "eth_getTransactionReceipt": 15,
+    "eth_getBalance": 19,
+    "eth_estimateGas": 20,
+    "eth_call": 26,
+    "eth_getTransactionCount": 26,
+    "eth_sendRawTransaction": 40,
+}
+RPC_DEFAULT_METHOD_COST = 26
+RPC_ENDPOINT_ERROR_CODES = {429, -32005}  # rate limit / limit exceeded — проблема endpoint'а, а не запроса
+
+class ThrottledError(Exception):
+    pass
+
+class TokenBucket:
+    def __init__(self, name: str, rate: float, burst: float):
+        self.name = name
+        self.rate = rate
+        self.capacity = burst
+        self._tokens = burst
+        self._updated = time.monotonic()
+        self._blocked_until = 0.0
+        self._lock = threading.Lock()
+
+    def _reserve(self, cost: float) -> float:
+        # Списывает токены сразу (в долг) и возвращает, сколько ждать: очередь ожидающих честная.
+        # rate <= 0 — без лимита, но Retry-After из throttled() соблюдается и тогда
+        with self._lock:
+            now = time.monotonic()
+            if self.rate <= 0:
+                wait = max(0.0, self._blocked_until - now)
+            else:
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                self._tokens -= cost
+                wait = max(0.0, -self._tokens / self.rate, self._blocked_until - now)
+        if wait > 0:
+            METRICS.observe("anyarb_rate_limit_wait_seconds", wait, limiter=self.name)
+        return wait
+
+    def acquire(self, cost: float = 1):
+        wait = self._reserve(cost)
+        if wait > 0:
+            time.sleep(wait)
+
+    async def acquire_async(self, cost: float = 1):
+        wait = self._reserve(cost)
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+    def throttled(self, retry_after: float):
+        with self._lock:
+            self._blocked_until = max(self._blocked_until, time.monotonic() + retry_after)
+            self._tokens = min(self._tokens, 0.0)
+        METRICS.inc("anyarb_throttled_total", limiter=self.name)
+
+class AimdController:
+    # Additive increase: +1 к лимиту за каждые `limit` успешных отправок; multiplicative decrease: /2 на 429
+    def __init__(self, nonce_manager, ceiling: int, cooldown_sec: float = 1.0):
+        self.nonce_manager = nonce_manager
+        self.ceiling = ceiling
+        self.cooldown_sec = cooldown_sec
+        self._successes = 0
+        self._last_decrease = 0.0
+        self._lock = threading.Lock()
+
+    def on_success(self):
+        if not CONFIG["ADAPTIVE_INFLIGHT"]:
+            return
+        with self._lock:
+            self._successes += 1
+            limit = self.nonce_manager.max_inflight
+            if self._successes >= limit and limit < self.ceiling:
+                self.nonce_manager.max_inflight = limit + 1
+                self._successes = 0
+
+    def on_throttle(self):
+        if not CONFIG["ADAPTIVE_INFLIGHT"]:
+            return
+        with self._lock:
+            now = time.monotonic()
+            # Пачка 429 от одного всплеска — одно снижение
+            if now - self._last_decrease < self.cooldown_sec:
+                return
+            self._last_decrease = now
+            self._successes = 0
+            self.nonce_manager.max_inflight = max(1, self.nonce_manager.max_inflight // 2)
+        LOG.warning("inflight_decrease", max_inflight=self.nonce_manager.max_inflight)
+
+RATE_LIMITERS = {}
+_rate_limiters_lock = threading.Lock()
+
+def rate_limit_key(url: str) -> str:
+    return f"key:{APIKEY}" if APIKEY and APIKEY in url else urlparse(url).netloc
+
+def rate_limit_label(key: str) -> str:
+    # Ключ API остаётся только ключом словаря: в метки метрик и тексты ошибок он не попадает
+    return "key:alchemy" if key.startswith("key:") else key
+
+def get_rate_limiter(key: str, rate: float, burst: float) -> TokenBucket:
+    with _rate_limiters_lock:
+        limiter = RATE_LIMITERS.get(key)
+        if limiter is None:
+            limiter = RATE_LIMITERS[key] = TokenBucket(rate_limit_label(key), rate, burst)
+        return limiter
+
+def rpc_cost(method: str) -> int:
+    return RPC_METHOD_COST.get(method, RPC_DEFAULT_METHOD_COST)
+
+def _retry_after(headers) -> float:
+    try:
+        return float(headers.get("Retry-After"))
+    except (TypeError, ValueError):
+        return CONFIG["THROTTLE_BACKOFF_SEC"]
+
+def _throttle_response(response) -> bool:
+    # Троттлинг может прийти и ответом JSON-RPC (Alchemy: 429 / -32005), а не только HTTP-статусом
+    if isinstance(response, dict) and isinstance(response.get("error"), dict):
+        return response["error"].get("code") in RPC_ENDPOINT_ERROR_CODES
+    return False
+
+class RateLimitedHTTPProvider(Web3.HTTPProvider):
+    def __init__(self, url: str, **kwargs):
+        # HTTP-ошибки (и 429) web3 не повторяет — этим занимается лимитер
+        super().__init__(url, exception_retry_configuration=ExceptionRetryConfiguration(
+            errors=(requests.ConnectionError, requests.Timeout)), **kwargs)
+        self.limiter = get_rate_limiter(rate_limit_key(url), CONFIG["RPC_CU_PER_SEC"], CONFIG["RPC_CU_BURST"])
+
+    def _limited(self, cost: int, request):
+        for attempt in range(CONFIG["THROTTLE_RETRIES"] + 1):
+            self.limiter.acquire(cost)
+            try:
+                response = request()
+            except requests.HTTPError as e:
+                if e.response is None or e.response.status_code != 429:
+                    raise
+                retry_after = _retry_after(e.response.headers)
+            else:
+                if not _throttle_response(response):
+                    return response
+                retry_after = CONFIG["THROTTLE_BACKOFF_SEC"]
+            self.limiter.throttled(retry_after)
+            AIMD.on_throttle()
+        raise ThrottledError(f"{self.limiter.name}: 429 после {CONFIG['THROTTLE_RETRIES']} повторов")
+
+    def make_request(self, method, params):
+        return self._limited(rpc_cost(method), lambda: super(RateLimitedHTTPProvider, self).make_request(method, params))
+
+    def make_batch_request(self, batch_requests):
+        cost = sum(rpc_cost(method) for method, _ in batch_requests)
+        return self._limited(cost, lambda: super(RateLimitedHTTPProvider, self).make_batch_request(batch_requests))
+
+class RateLimitedAsyncHTTPProvider(AsyncWeb3.AsyncHTTPProvider):
+    def __init__(self, url: str, **kwargs):
+        super().__init__(url, exception_retry_configuration=ExceptionRetryConfiguration(
+            errors=(aiohttp.ClientConnectionError, asyncio.TimeoutError)), **kwargs)
+        self.limiter = get_rate_limiter(rate_limit_key(url), CONFIG["RPC_CU_PER_SEC"], CONFIG["RPC_CU_BURST"])
+
+    async def _limited(self, cost: int, request):
+        for attempt in range(CONFIG["THROTTLE_RETRIES"] + 1):
+            await self.limiter.acquire_async(cost)
+            try:
+                response = await request()
+            except aiohttp.ClientResponseError as e:
+                if e.status != 429:
+                    raise
+                retry_after = _retry_after(e.headers or {})
+            else:
+                if not _throttle_response(response):
+                    return response
+                retry_after = CONFIG["THROTTLE_BACKOFF_SEC"]
+            self.limiter.throttled(retry_after)
+            AIMD.on_throttle()
+        raise ThrottledError(f"{self.limiter.name}: 429 после {CONFIG['THROTTLE_RETRIES']} повторов")
+
+    async def make_request(self, method, params):
+        return await self._limited(rpc_cost(method), lambda: super(RateLimitedAsyncHTTPProvider, self).make_request(method, params))
+
+    async def make_batch_request(self, batch_requests):
+        cost = sum(rpc_cost(method) for method, _ in batch_requests)
+        return await self._limited(cost, lambda: super(RateLimitedAsyncHTTPProvider, self).make_batch_request(batch_requests))
+
+# ------------------- RPC POOL ----------------------
+# В RPCS вместо строки можно указать список URL. Тогда сеть обслуживает пул: чтения идут на самый быстрый
+# здоровый endpoint (с переключением на следующий при ошибке), send_raw_transaction рассылается на все,
+# упавшие endpoint'ы уходят в карантин с экспоненциальной паузой. Статистика пула общая для sync и async.
+
+RPC_LATENCY_EWMA_ALPHA = 0.2
+RPC_BROADCAST_METHODS = {"eth_sendRawTransaction"}
+
+class RpcEndpointError(Exception):
+    # JSON-RPC ответ, который говорит о проблеме endpoint'а: пробуем следующий
+    def __init__(self, response: dict):
+        super().__init__(response.get("error"))
+        self.response = response
+
+class RpcEndpoint:
+    def __init__(self, url: str, index: int = 0):
+        self.url = url
+        self.label = f"{urlparse(url).hostname}#{index}"  # для метрик и логов: в пути URL может быть ключ API
+        self.latency = None  # EWMA, сек; None — ещё не измерен
+        self.error_rate = 0.0  # EWMA доли ошибок
+        self.failures = 0  # ошибок подряд
+        self.quarantined_until = 0.0
+
+    def score(self) -> float:
+        return (self.latency or 0.0) * (1 + 4 * self.error_rate)
+
+class RpcPool:
+    def __init__(self, chain: str, urls: list):
+        self.chain = chain
+        self.endpoints = [RpcEndpoint(url, i) for i, url in enumerate(urls)]
+        self._lock = threading.Lock()
+
+    def ranked(self) -> list:
+        # Здоровые endpoint'ы по возрастанию score; если все в карантине — те, что выйдут из него раньше
+        now = time.time()
+        with self._lock:
+            healthy = [e for e in self.endpoints if e.quarantined_until <= now]
+            if healthy:
+                return sorted(healthy, key=RpcEndpoint.score)
+            return sorted(self.endpoints, key=lambda e: e.quarantined_until)
+
+    def record_success(self, endpoint: RpcEndpoint, elapsed: float):
+        with self._lock:
+            if endpoint.latency is None:
+                endpoint.latency = elapsed
+            else:
+                endpoint.latency += RPC_LATENCY_EWMA_ALPHA * (elapsed - endpoint.latency)
+            endpoint.error_rate *= 1 - RPC_LATENCY_EWMA_ALPHA
+            endpoint.failures = 0
+        METRICS.observe("anyarb_rpc_seconds", elapsed, chain=self.chain, endpoint=endpoint.label)
+
+    def record_failure(self, endpoint: RpcEndpoint, error):
+        with self._lock:
+            endpoint.error_rate += RPC_LATENCY_EWMA_ALPHA * (1 - endpoint.error_rate)
+            endpoint.failures += 1
+            backoff = min(CONFIG["RPC_QUARANTINE_BASE_SEC"] * 2 ** (endpoint.failures - 1),
+                          CONFIG["RPC_QUARANTINE_MAX_SEC"])
+            endpoint.quarantined_until = time.time() + backoff
+        METRICS.inc("anyarb_rpc_errors_total", chain=self.chain, endpoint=endpoint.label)
+        LOG.warning("rpc_quarantine", chain=self.chain, endpoint=endpoint.label, backoff_sec=backoff, error=error)
+
+def _check_endpoint_response(response):
+    if isinstance(response, dict) and isinstance(response.get("error"), dict):
+        if response["error"].get("code") in RPC_ENDPOINT_ERROR_CODES:
+            raise RpcEndpointError(response)
+    return response
+
+def _pool_failure_result(error: Exception):
+    # Все endpoint'ы отказали: ответ с ошибкой отдаём web3 как есть, исключение — пробрасываем
+    if isinstance(error, RpcEndpointError):
+        return error.response
+    raise error
+
+def _consume_task_result(task):
+    # Результат отменённого или опоздавшего запроса никто не ждёт — забираем, чтобы asyncio не ругался
+    if not task.cancelled():
+        task.exception()
+
+def _broadcast_accepted(result) -> bool:
+    # Ответ с ошибкой (already known от соседнего узла, nonce too low) — ждём остальные endpoint'ы
+    return not isinstance(result, Exception) and "error" not in result
+
+def _first_broadcast_result(results: list):
+    # Ни один endpoint не принял TX: отдаём ошибку узла (nonce too low и т.п.), а не сетевую
+    for result in results:
+        if not isinstance(result, Exception):
+            return result
+    return _pool_failure_result(results[0])
+
+RPC_EXECUTOR = ThreadPoolExecutor(thread_name_prefix="rpc")
+
+class PooledHTTPProvider(JSONBaseProvider):
+    def __init__(self, pool: RpcPool):
+        super().__init__()
+        self.pool = pool
+        self._providers = {e.url: make_single_http_provider(e.url) for e in pool.endpoints}
+
+    def _call(self, endpoint: RpcEndpoint, request):
+        started = time.perf_counter()
+        try:
+            response = _check_endpoint_response(request(self._providers[endpoint.url]))
+        except Exception as e:
+            self.pool.record_failure(endpoint, e)
+            raise
+        self.pool.record_success(endpoint, time.perf_counter() - started)
+        return response
+
+    def _failover(self, endpoints: list, request):
+        error = None
+        for endpoint in endpoints:
+            try:
+                return self._call(endpoint, request)
+            except Exception as e:
+                error = e
+        return _pool_failure_result(error)
+
+    def _hedged(self, request):
+        endpoints = self.pool.ranked()
+        if len(endpoints) < 2:
+            return self._failover(endpoints, request)
+        futures = [RPC_EXECUTOR.submit(self._call, endpoints[0], request)]
+        done, _ = wait(futures, timeout=CONFIG["RPC_HEDGE_DELAY_MS"] / 1000)
+        if not done or futures[0].exception() is not None:
+            futures.append(RPC_EXECUTOR.submit(self._call, endpoints[1], request))
+        for future in as_completed(futures):
+            if future.exception() is None:
+                return future.result()
+        return self._failover(endpoints[2:], request) if endpoints[2:] else _pool_failure_result(futures[0].exception())
+
+    def _broadcast(self, request):
+        futures = [RPC_EXECUTOR.submit(self._call, e, request) for e in self.pool.ranked()]
+        results = []
+        for future in as_completed(futures):
+            result = future.exception() or future.result()
+            if _broadcast_accepted(result):
+                return result
+            results.append(result)
+        return _first_broadcast_result(results)
+
+    def make_request(self, method, params):
+        request = lambda provider: provider.make_request(method, params)
+        if method in RPC_BROADCAST_METHODS:
+            return self._broadcast(request)
+        if CONFIG["RPC_HEDGE_READS"]:
+            return self._hedged(request)
+        return self._failover(self.pool.ranked(), request)
+
+    def make_batch_request(self, batch_requests):
+        return self._failover(self.pool.ranked(), lambda provider: provider.make_batch_request(batch_requests))
+
+class PooledAsyncHTTPProvider(AsyncJSONBaseProvider):
+    def __init__(self, pool: RpcPool):
+        super().__init__()
+        self.pool = pool
+        self._providers = {e.url: make_single_async_http_provider(e.url) for e in pool.endpoints}
+
+    async def _call(self, endpoint: RpcEndpoint, request):
+        started = time.perf_counter()
+        try:
+            response = _check_endpoint_response(await request(self._providers[endpoint.url]))
+        except Exception as e:
+            self.pool.record_failure(endpoint, e)
+            raise
+        self.pool.record_success(endpoint, time.perf_counter() - started)
+        return response
+
+    async def _failover(self, endpoints: list, request):
+        error = None
+        for endpoint in endpoints:
+            try:
+                return await self._call(endpoint, request)
+            except Exception as e:
+                error = e
+        return _pool_failure_result(error)
+
+    def _spawn(self, endpoint: RpcEndpoint, request):
+        task = asyncio.ensure_future(self._call(endpoint, request))
+        task.add_done_callback(_consume_task_result)
+        return task
+
+    async def _hedged(self, request):
+        endpoints = self.pool.ranked()
+        if len(endpoints) < 2:
+            return await self._failover(endpoints, request)
+        tasks = [self._spawn(endpoints[0], request)]
+        done, _ = await asyncio.wait(tasks, timeout=CONFIG["RPC_HEDGE_DELAY_MS"] / 1000)
+        if not done or tasks[0].exception() is not None:
+            tasks.append(self._spawn(endpoints[1], request))
+        error = None
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                try:
+                    return await next_done
+                except Exception as e:
+                    error = error or e
+        finally:
+            # Проигравшее чтение больше не нужно
+            for task in tasks:
+                task.cancel()
+        return await self._failover(endpoints[2:], request) if endpoints[2:] else _pool_failure_result(error)
+
+    async def _broadcast(self, request):
+        # Опоздавшие рассылки не отменяются: TX должна дойти до всех endpoint'ов
+        tasks = [self._spawn(e, request) for e in self.pool.ranked()]
+        results = []
+        for next_done in asyncio.as_completed(tasks):
+            try:
+                result = await next_done
+            except Exception as e:
+                result = e
+            if _broadcast_accepted(result):
+                return result
+            results.append(result)
+        return _first_broadcast_result(results)
+
+    async def make_request(self, method, params):
+        request = lambda provider: provider.make_request(method, params)
+        if method in RPC_BROADCAST_METHODS:
+            return await self._broadcast(request)
+        if CONFIG["RPC_HEDGE_READS"]:
+            return await self._hedged(request)
+        return await self._failover(self.pool.ranked(), request)
+
+    async def make_batch_request(self, batch_requests):
+        return await self._failover(self.pool.ranked(), lambda provider: provider.make_batch_request(batch_requests))
+
+    async def disconnect(self):
+        for provider in self._providers.values():
+            await provider.disconnect()
+
+RPC_POOLS = {}
+
+def _all_rpc_urls(chain: str) -> list:
+    urls = RPCS[chain]
+    return [urls] if isinstance(urls, str) else list(urls)
+
+def rpc_urls(chain: str) -> list:
+    return [url for url in _all_rpc_urls(chain) if not url.startswith(("ws://", "wss://"))]
+
+def ws_url(chain: str):
+    return next((url for url in _all_rpc_urls(chain) if url.startswith(("ws://", "wss://"))), None)
+
+def get_rpc_pool(chain: str) -> RpcPool:
+    urls = rpc_urls(chain)
+    pool = RPC_POOLS.get(chain)
+    if pool is None or [e.url for e in pool.endpoints] != urls:
+        pool = RPC_POOLS[chain] = RpcPool(chain, urls)
+    return pool
+
+def make_single_http_provider(url: str):
+    return RateLimitedHTTPProvider(url, cache_allowed_requests=True, cacheable_requests=RPC_CACHEABLE_REQUESTS)
+
+def make_single_async_http_provider(url: str):
+    return RateLimitedAsyncHTTPProvider(url, cache_allowed_requests=True, cacheable_requests=RPC_CACHEABLE_REQUESTS)
+
+def make_http_provider(chain: str):
+    urls = rpc_urls(chain)
+    if len(urls) == 1:
+        return make_single_http_provider(urls[0])
+    return PooledHTTPProvider(get_rpc_pool(chain))
+
+def make_async_http_provider(chain: str):
+    urls = rpc_urls(chain)
+    if len(urls) == 1:
+        return make_single_async_http_provider(urls[0])
+    return PooledAsyncHTTPProvider(get_rpc_pool(chain))
+
+WEB3_INSTANCES = {name: Web3(make_http_provider(name)) for name in RPCS}
+# Ключ разбирается один раз: подпись идёт через готовый объект аккаунта
+ACCOUNT = Account.from_key(PRIVATE_KEY)
+SENDER_ADDRESS = ACCOUNT.address
+
+# ------------------- EVENT LOG ----------------------
+# Путь отправки не форматирует строк и не пишет в stdout: LOG.info("order_sent", ...) кладёт в очередь
+# типизированное событие (маршрут, nonce, хэш, тайминги стадий, исключение как есть), форматирует и пишет
+# его фоновый поток — в консоль по шаблону EVENT_FORMATS или в JSONL. Если вывод не успевает (screen,
+# медленный pipe) и в очереди LOG_BUFFER_EVENTS событий, новые debug-события отбрасываются, а при
+# двойном переполнении вытесняются самые старые.
+
+LOG_LEVELS = {"debug": 10, "info": 20, "warning": 30, "error": 40}
+
+EVENT_FORMATS = {
+    "sender": "👤 Sender address: {address}",
+    "estimate_refresh": "🌐 Обновление estimate {route} из API",
+    "estimate_cached": "♻️ Используется estimate из кэша с флуктуацией {fluct_percent:.5f}%",
+    "estimate_error": "⚠️ Ошибка при получении estimate {route}: {error}",
+    "quote_off_curve": "🌐 Котировка {route} для {amount_eth:g} ETH вне кривой, запрос в API",
+    "order_start": "\n▶️ Пробуем отправить TX: {route}",
+    "order_presigned": "\n▶️ Отправляем заранее подписанную TX: {route}",
+    "presigned_expired": "🗑 [{chain}] Заранее подписанные ордера устарели, собираем заново",
+    "balance": "💰 [{chain}] Баланс: {balance_eth:.4f} ETH",
+    "skip_low_balance": "⚠️  [{chain}] Недостаточный баланс (< {min_eth} ETH). Пропуск.",
+    "skip_small_order": "⚠️  [{chain}] Баланса не хватает на ордер от {min_eth} ETH. Пропуск.",
+    "skip_inflight": "⏳ [{chain}] {inflight} TX ещё не подтверждены. Пропуск.",
+    "sim_reverted": "🚫 [{route}] Транзакция отклонена при симуляции: ({reason}, {kind})",
+    "order_sent": "✅ [{route}] TX отправлена: {tx_hash}",
+    "send_failed": "❌ [{chain}] Ошибка при отправке TX: {error}",
+    "nonce_resync": "🔁 [{chain}] Рассинхрон nonce, перечитываем из RPC",
+    "order_finished": "⏱ [{route}] {outcome} за {total_ms:.1f} мс: {stages_ms}",
+    "no_targets": "⚠️ [{chain}] Нет доступных target-цепочек. Ждём...",
+    "rpc_quarantine": "🚧 [{chain}] RPC {endpoint} в карантине на {backoff_sec:.0f} с: {error}",
+    "delay": "🕑 [{chain}] Ждём {delay_sec:.1f} секунд перед следующим циклом...",
+    "worker_error": "⚠️ [{chain}] Ошибка в цикле отправки: {error}. Повтор через {retry_in:.0f} сек",
+    "task_restart": "⚠️ Задача {task} завершилась ошибкой: {error}. Перезапуск через {retry_in:.0f} сек",
+    "inflight_decrease": "🐢 Провайдер троттлит: лимит неподтверждённых TX на сеть снижен до {max_inflight}",
+    "batch_unsupported": "⚠️ [{chain}] RPC не поддерживает batch-запросы ({error}), перехожу на одиночные",
+    "route_restored": "🔌 [{route}] Маршрут снова работает",
+    "route_tripped": "⛔ [{route}] {failures} persistent-ревертов подряд: маршрут выключен на {cooldown_sec:.0f} сек",
+    "plan_built": "🧭 План маршрутов на {orders} ордеров: {summary}",
+    "plan_empty": "🧭 План маршрутов пуст: ни одна сеть не держит баланс выше порога отправки",
+    "balance_check": "\n🔍 Проверка балансов...",
+    "balance_report": "   - {chain}: {balance_eth:.4f} ETH",
+    "receipt_stats": "   - {chain}: подтверждено {confirmed}, откатилось {reverted}, потеряно {dropped},"
+                     " включение в среднем {avg_latency_sec:.1f} сек (макс {max_latency_sec:.1f})",
+    "balance_refresh_error": "⚠️ Ошибка фонового обновления балансов: {error}",
+    "order_confirmed": "📦 [{route}] TX {tx_hash} в блоке {block} за {latency_sec:.1f} сек, газ {gas_used}",
+    "order_reverted": "💥 [{route}] TX {tx_hash} откатилась в блоке {block}",
+    "receipt_timeout": "⌛ [{chain}] Нет receipt для {tx_hash} дольше {timeout_sec} сек, перестаём следить",
+    "receipt_poll_error": "⚠️ [{chain}] Ошибка опроса receipts: {error}",
+    "stuck_fee_capped": "🧊 [{chain}] TX {tx_hash} (nonce {nonce}) зависла, но fee упёрся в {max_fee_gwei} gwei — ждём",
+    "tx_replaced": "⛽ [{chain}] TX nonce {nonce} висит {blocks} блоков, заменена с maxFee {max_fee_gwei:.2f} gwei: {tx_hash}",
+    "nonce_gap_filled": "🧱 [{chain}] Дыра в nonce {nonce} перед pending TX — отправлена заглушка {tx_hash}",
+    "nonce_gap_closed": "🧱 [{chain}] Дыра в nonce {nonce} закрыта: {tx_hash}",
+    "stuck_check_error": "⚠️ [{chain}] Ошибка проверки зависших TX: {error}",
+    "journal_restored": "🗂 Журнал {path}: {pending} неподтверждённых TX, {estimates} estimate в кэше,"
+                        " подтверждено ранее: {confirmed}",
+    "journal_write_error": "⚠️ Ошибка записи журнала ордеров: {error}",
+    "pause_schedule": "🕒 Сгенерировано расписание пауз на {date}: {pauses} пауз (большая - {big_pause})",
+    "pause_schedule_read_error": "⚠️ Ошибка чтения расписания пауз: {error}",
+    "pause_schedule_write_error": "⚠️ Ошибка записи расписания пауз: {error}",
+    "pause": "⏸ {pause_type} пауза активна, спим {sleep_sec} сек...",
+    "pause_big_finished": "🔄 Большая пауза закончилась, обновляем расписание пауз...",
+    "presign_error": "⚠️ [{chain}] Ошибка подготовки ордеров заранее: {error}",
+    "head_refresh_error": "⚠️ [{chain}] Ошибка обновления по новому блоку: {error}",
+    "ws_subscribed": "📡 [{chain}] Подписка на newHeads: {url}",
+    "ws_disconnected": "⚠️ [{chain}] WebSocket отвалился ({error}), переподключение через {retry_in} с, пока опрос по HTTP",
+    "chain_ready": "🟢 [{chain}] Сеть готова за {elapsed_sec:.2f} сек, баланс {balance_eth:.4f} ETH",
+    "warm_up_failed": "⚠️ [{chain}] Прогрев не удался: {error}. Повтор через {retry_in:.0f} сек",
+    "warm_up_timeout": "⚠️ За {timeout_sec} сек не прогрелась ни одна source-сеть, продолжаем ждать в цикле",
+    "metrics_started": "📈 Метрики: {url}",
+    "metrics_snapshot_error": "⚠️ Ошибка записи снимка метрик: {error}",
+    "metrics_start_error": "⚠️ Не удалось запустить эндпоинт метрик: {error}",
+}
+
+def _console_fields(fields: dict) -> dict:
+    out = dict(fields)
+    if "from_chain" in out and "route" not in out:
+        out["route"] = f"{out['from_chain'].upper()} → {out['to_chain'].upper()}"
+    if "chain" in out:
+        out["chain"] = out["chain"].upper()
+    for key in [k for k in out if k.endswith("_wei")]:
+        out[key[:-len("_wei")] + "_eth"] = out[key] / 10**18
+    return out
+
+def _json_fields(fields: dict) -> dict:
+    out = {}
+    for key, value in fields.items():
+        if isinstance(value, BaseException):
+            out["error_class"] = type(value).__name__
+            value = str(value)
+        out[key] = value
+    return out
+
+class EventLog:
+    def __init__(self, level: str, fmt: str, path: str, capacity: int):
+        self.level = LOG_LEVELS[level]
+        self.fmt = fmt
+        self.path = path
+        self.capacity = capacity
+        self.dropped = 0
+        self._cond = threading.Condition()
+        self._queue = deque()
+        self._idle = True
+        self._file = None
+        threading.Thread(target=self._write_loop, name="event-log", daemon=True).start()
+
+    def emit(self, level: str, event: str, **fields):
+        if LOG_LEVELS[level] < self.level:
+            return
+        with self._cond:
+            if len(self._queue) >= self.capacity * (1 if level == "debug" else 2):
+                self.dropped += 1
+                if level == "debug":
+                    return
+                self._queue.popleft()
+            self._queue.append((time.time(), level, event, fields))
+            self._cond.notify()
+
+    def debug(self, event: str, **fields):
+        self.emit("debug", event, **fields)
+
+    def info(self, event: str, **fields):
+        self.emit("info", event, **fields)
+
+    def warning(self, event: str, **fields):
+        self.emit("warning", event, **fields)
+
+    def error(self, event: str, **fields):
+        self.emit("error", event, **fields)
+
+    def format(self, ts: float, level: str, event: str, fields: dict) -> str:
+        if self.fmt == "jsonl":
+            line = json.dumps({"ts": round(ts, 3), "level": level, "event": event, **_json_fields(fields)},
+                              ensure_ascii=False, default=str)
+        else:
+            template = EVENT_FORMATS.get(event)
+            line = f"{event} {fields}" if template is None else template.format(**_console_fields(fields))
+        # Тексты исключений requests/web3 содержат URL RPC вместе с ключом API
+        return (line.replace(APIKEY, "***") if APIKEY else line) + "\n"
+
+    def _stream(self):
+        if not self.path:
+            return sys.stdout  # берётся при каждой записи: stdout могут подменить (бенчмарк)
+        if self._file is None:
+            self._file = open(self.path, "a", encoding="utf-8")
+        return self._file
+
+    def _write_loop(self):
+        while True:
+            with self._cond:
+                while not self._queue:
+                    self._idle = True
+                    self._cond.notify_all()
+                    self._cond.wait()
+                self._idle = False
+                batch = list(self._queue)
+                self._queue.clear()
+            lines = []
+            for record in batch:
+                try:
+                    lines.append(self.format(*record))
+                except Exception as e:
+                    lines.append(f"⚠️ Не удалось отформатировать событие {record[2]}: {e}\n")
+            try:
+                stream = self._stream()
+                stream.write("".join(lines))
+                stream.flush()
+            except Exception:
+                pass
+
+    def flush(self, timeout: float = 5):
+        with self._cond:
+            self._cond.wait_for(lambda: not self._queue and self._idle, timeout)
+
+LOG = EventLog(CONFIG["LOG_LEVEL"], CONFIG["LOG_FORMAT"], CONFIG["LOG_FILE"], CONFIG["LOG_BUFFER_EVENTS"])
+atexit.register(LOG.flush)
+LOG.info("sender", address=SENDER_ADDRESS)
+
+# ------------------- METRICS ----------------------
+# Счётчики и гистограммы задержек по стадиям ордера (метки: сеть, маршрут). Запись — словарь под
+# локом, форматирование только при запросе /metrics или при записи JSON-снимка.
+
+METRICS_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+# Строки # HELP в выводе /metrics; # TYPE пишется для каждого семейства и без описания
+METRICS_HELP = {
+    "anyarb_order_seconds": "Время ордера — сумма его стадий",
+    "anyarb_stage_seconds": "Время стадии ордера",
+    "anyarb_inclusion_seconds": "Время от отправки TX до включения в блок",
+    "anyarb_receipts_total": "Полученные receipts по статусу",
+    "anyarb_rpc_seconds": "Время RPC-запроса к endpoint'у пула",
+    "anyarb_rpc_errors_total": "Ошибки RPC-запросов к endpoint'у пула",
+    "anyarb_rate_limit_wait_seconds": "Ожидание токена в лимитере запросов",
+    "anyarb_throttled_total": "Ответы 429 от провайдера",
+    "anyarb_estimate_fetch_seconds": "Время обновления котировок маршрута в API",
+    "anyarb_estimate_errors_total": "Ошибки обновления котировок",
+    "anyarb_estimate_cache_hits_total": "Котировки из кэша",
+    "anyarb_estimate_cache_misses_total": "Котировки, которых не было в кэше",
+    "anyarb_quote_curve_misses_total": "Суммы вне локальной кривой котировок",
+    "anyarb_simulation_cache_hits_total": "Симуляции, пропущенные по кэшу",
+    "anyarb_simulation_cache_misses_total": "Симуляции, выполненные через RPC",
+    "anyarb_route_breaker_trips_total": "Выключения маршрута circuit breaker'ом",
+    "anyarb_tx_replaced_total": "Зависшие TX, заменённые с повышенным fee",
+    "anyarb_nonce_gaps_filled_total": "Дыры в nonce, закрытые заглушками",
+    "anyarb_new_heads_total": "Новые блоки из подписки newHeads",
+    "anyarb_chain_warmup_seconds": "Время прогрева сети",
+    "anyarb_chain_warmup_errors_total": "Неудачные попытки прогрева сети",
+}
+
+class Metrics:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters = {}    # (name, labels) -> value
+        self._histograms = {}  # (name, labels) -> [bucket counts..., +Inf, sum]
+
+    def inc(self, name: str, value: float = 1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def observe(self, name: str, seconds: float, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            hist = self._histograms.get(key)
+            if hist is None:
+                hist = self._histograms[key] = [0] * (len(METRICS_BUCKETS) + 2)
+            hist[bisect.bisect_left(METRICS_BUCKETS, seconds)] += 1
+            hist[-1] += seconds
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            counters = dict(self._counters)
+            histograms = {key: list(hist) for key, hist in self._histograms.items()}
+        return {
+            "timestamp": time.time(),
+            "counters": [{"name": name, "labels": dict(labels), "value": value}
+                         for (name, labels), value in counters.items()],
+            "histograms": [{"name": name, "labels": dict(labels), "buckets": dict(zip(METRICS_BUCKETS, hist)),
+                            "count": sum(hist[:-1]), "sum": hist[-1]}
+                           for (name, labels), hist in histograms.items()],
+        }
+
+    def render_prometheus(self) -> str:
+        with self._lock:
+            counters = sorted(self._counters.items())
+            histograms = sorted((key, list(hist)) for key, hist in self._histograms.items())
+        lines = []
+        family = None
+        for (name, labels), value in counters:
+            if name != family:
+                family = name
+                lines.extend(_family_header(name, "counter"))
+            lines.append(f"{name}{_format_labels(labels)} {value}")
+        for (name, labels), hist in histograms:
+            if name != family:
+                family = name
+                lines.extend(_family_header(name, "histogram"))
+            cumulative = 0
+            for bound, count in zip(METRICS_BUCKETS + ("+Inf",), hist[:-1]):
+                cumulative += count
+                lines.append(f"{name}_bucket{_format_labels(labels + (('le', str(bound)),))} {cumulative}")
+            lines.append(f"{name}_sum{_format_labels(labels)} {hist[-1]}")
+            lines.append(f"{name}_count{_format_labels(labels)} {cumulative}")
+        return "\n".join(lines) + "\n"
+
+def _family_header(name: str, kind: str) -> list:
+    lines = [f"# HELP {name} {METRICS_HELP[name]}"] if name in METRICS_HELP else []
+    return lines + [f"# TYPE {name} {kind}"]
+
+def _format_labels(labels) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{k}="{v}"' for k, v in labels) + "}"
+
+METRICS = Metrics()
+
+class OrderTimer:
+    # Засекает стадии ордера подряд: lap("stage") пишет время с предыдущей отметки.
+    # Время ордера — сумма стадий: ожидание заранее подписанного ордера в очереди не считается.
+    def __init__(self, from_chain: str, to_chain: str):
+        self.chain = from_chain
+        self.to_chain = to_chain
+        self.route = f"{from_chain}→{to_chain}"
+        self.last = time.perf_counter()
+        self.busy = 0.0
+        self.stages = {}
+
+    def resume(self):
+        self.last = time.perf_counter()
+
+    def lap(self, stage: str):
+        now = time.perf_counter()
+        METRICS.observe("anyarb_stage_seconds", now - self.last, stage=stage, chain=self.chain, route=self.route)
+        self.busy += now - self.last
+        self.stages[stage] = self.stages.get(stage, 0.0) + now - self.last
+        self.last = now
+
+    def finish(self, outcome: str):
+        METRICS.observe("anyarb_order_seconds", self.busy, chain=self.chain, route=self.route)
+        METRICS.inc(f"anyarb_orders_{outcome}_total", chain=self.chain, route=self.route)
+        LOG.debug("order_finished", from_chain=self.chain, to_chain=self.to_chain, outcome=outcome,
+                  total_ms=self.busy * 1000, stages_ms={k: round(v * 1000, 1) for k, v in self.stages.items()})
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.rstrip("/") not in ("/metrics", ""):
+            self.send_error(404)
+            return
+        body = METRICS.render_prometheus().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+def metrics_snapshot_loop():
+    while True:
+        time.sleep(CONFIG["METRICS_SNAPSHOT_INTERVAL_SEC"])
+        try:
+            tmp_path = CONFIG["METRICS_SNAPSHOT_FILE"] + ".tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(METRICS.snapshot(), f)
+            os.replace(tmp_path, CONFIG["METRICS_SNAPSHOT_FILE"])
+        except Exception as e:
+            LOG.warning("metrics_snapshot_error", error=e)
+
+def start_metrics():
+    if CONFIG["METRICS_PORT"]:
+        try:
+            server = ThreadingHTTPServer(("127.0.0.1", CONFIG["METRICS_PORT"]), _MetricsHandler)
+            threading.Thread(target=server.serve_forever, name="metrics-http", daemon=True).start()
+            LOG.info("metrics_started", url=f"http://127.0.0.1:{CONFIG['METRICS_PORT']}/metrics")
+        except OSError as e:
+            LOG.warning("metrics_start_error", error=e)
+    if CONFIG["METRICS_SNAPSHOT_FILE"]:
+        threading.Thread(target=metrics_snapshot_loop, name="metrics-snapshot", daemon=True).start()
+
+# ------------------- NONCE MANAGER ----------------------
+
+# "replacement transaction underpriced" — nonce уже занят TX в мемпуле (например, broadcast, который
+# вернул ошибку, на самом деле дошёл), значит локальный счётчик разошёлся с сетью
+NONCE_RESYNC_ERRORS = ("nonce too low", "already known", "nonce too high", "replacement transaction underpriced")
+
+class NonceManager:
+    # Локальная выдача nonce по сетям: один get_transaction_count при старте (или после
+    # ресинка), дальше nonce выдаются из памяти, до max_inflight неподтверждённых на сеть.
+    def __init__(self, max_inflight: int):
+        self.max_inflight = max_inflight
+        self._lock = threading.Lock()
+        self._next = {}       # chain -> следующий новый nonce
+        self._confirmed = {}  # chain -> nonce, ниже которого всё уже замайнено
+        self._free = {}       # chain -> heap возвращённых (неиспользованных) nonce
+        self._dropped = {}    # chain -> nonce TX, которые так и не попали в блок (receipt не дождались)
+
+    def is_seeded(self, chain: str) -> bool:
+        with self._lock:
+            return chain in self._next
+
+    def seed(self, chain: str, pending_count: int, confirmed_count: int = None):
+        with self._lock:
+            if chain in self._next:
+                return
+            self._next[chain] = pending_count
+            self._confirmed[chain] = pending_count if confirmed_count is None else confirmed_count
+            self._free[chain] = []
+            self._dropped[chain] = set()
+
+    def inflight(self, chain: str) -> int:
+        with self._lock:
+            return self._next.get(chain, 0) - self._confirmed.get(chain, 0) - len(self._free.get(chain, []))
+
+    def allocate(self, chain: str):
+        # Возвращает nonce или None, если лимит неподтверждённых TX на сеть исчерпан
+        with self._lock:
+            if chain not in self._next:
+                raise RuntimeError(f"nonce для {chain} не инициализирован")
+            free = self._free[chain]
+            if free:
+                return heapq.heappop(free)
+            if self._next[chain] - self._confirmed[chain] - len(free) >= self.max_inflight:
+                return None
+            nonce = self._next[chain]
+            self._next[chain] += 1
+            return nonce
+
+    def release(self, chain: str, nonce: int):
+        # nonce выдан, но TX не отправлена (например, не прошла симуляция) — вернуть в пул
+        with self._lock:
+            if chain not in self._next or nonce < self._confirmed[chain]:
+                return
+            if nonce == self._next[chain] - 1:
+                self._next[chain] -= 1
+                free = self._free[chain]
+                while free and max(free) == self._next[chain] - 1:
+                    free.remove(self._next[chain] - 1)
+                    self._next[chain] -= 1
+                heapq.heapify(free)
+            elif nonce not in self._free[chain]:
+                heapq.heappush(self._free[chain], nonce)
+
+    def mark_dropped(self, chain: str, nonce: int):
+        # TX с этим nonce перестали ждать — дыру на его месте можно закрыть заглушкой
+        with self._lock:
+            if chain in self._next and self._confirmed[chain] <= nonce < self._next[chain]:
+                self._dropped[chain].add(nonce)
+
+    def claim(self, chain: str, nonce: int) -> bool:
+        # Забрать конкретный nonce (заполнение дыры): он должен быть выдан ранее и сейчас свободен —
+        # возвращён в пул или принадлежал потерянной TX. nonce, который держит воркер, не отдаём
+        with self._lock:
+            if chain not in self._next or nonce < self._confirmed[chain] or nonce >= self._next[chain]:
+                return False
+            free = self._free[chain]
+            if nonce in free:
+                free.remove(nonce)
+                heapq.heapify(free)
+                return True
+            if nonce in self._dropped[chain]:
+                self._dropped[chain].discard(nonce)
+                return True
+            return False
+
+    def confirm_up_to(self, chain: str, latest_count: int):
+        # latest_count — get_transaction_count(sender, 'latest'): всё ниже уже в блоках
+        with self._lock:
+            if chain not in self._next or latest_count <= self._confirmed[chain]:
+                return
+            self._confirmed[chain] = latest_count
+            if latest_count > self._next[chain]:
+                self._next[chain] = latest_count
+            free = [n for n in self._free[chain] if n >= latest_count]
+            heapq.heapify(free)
+            self._free[chain] = free
+            self._dropped[chain] = {n for n in self._dropped[chain] if n >= latest_count}
+
+    def resync(self, chain: str):
+        # Сбросить состояние сети — следующий allocate потребует нового seed из RPC
+        with self._lock:
+            self._next.pop(chain, None)
+            self._confirmed.pop(chain, None)
+            self._free.pop(chain, None)
+            self._dropped.pop(chain, None)
+
+def is_nonce_error(err: Exception) -> bool:
+    msg = str(err).lower()
+    return any(marker in msg for marker in NONCE_RESYNC_ERRORS)
+
+NONCE_MANAGER = NonceManager(CONFIG["MAX_INFLIGHT_TX_PER_CHAIN"])
+AIMD = AimdController(NONCE_MANAGER, CONFIG["ADAPTIVE_INFLIGHT_MAX"])
+
+def allocate_nonce(w3: Web3, chain: str):
+    if not NONCE_MANAGER.is_seeded(chain):
+        NONCE_MANAGER.seed(chain, w3.eth.get_transaction_count(SENDER_ADDRESS, 'pending'),
+                           w3.eth.get_transaction_count(SENDER_ADDRESS, 'latest'))
+    nonce = NONCE_MANAGER.allocate(chain)
+    if nonce is None:
+        # Все слоты заняты — узнаём, сколько TX уже замайнено, и пробуем ещё раз
+        NONCE_MANAGER.confirm_up_to(chain, w3.eth.get_transaction_count(SENDER_ADDRESS, 'latest'))
+        nonce = NONCE_MANAGER.allocate(chain)
+    return nonce
+
+# ------------------- GAS ORACLE ----------------------
+# Calldata маршрута всегда одной формы, поэтому gas limit — скользящий максимум оценок маршрута (оценка
+# приходит из симуляции, см. SIMULATION CACHE). Base fee меняется раз в блок — он кэшируется по номеру
+# блока на всю сеть.
+
+GAS_LIMIT_MULTIPLIER = 1.1
+FALLBACK_GAS_LIMIT = 110_000
+
+class GasOracle:
+    def __init__(self, fee_ttl_sec: float, window: int):
+        self.fee_ttl_sec = fee_ttl_sec
+        self.window = window
+        self._lock = threading.Lock()
+        self._fees = {}        # chain -> (block_number, base_fee, fetched_at, pushed)
+        self._gas_used = {}    # (from_chain, to_chain) -> deque последних оценок
+
+    def fee_is_stale(self, chain: str) -> bool:
+        # Fee из newHeads обновляется каждым блоком и живёт, пока идут блоки
+        with self._lock:
+            fee = self._fees.get(chain)
+            if fee is None:
+                return True
+            ttl = CONFIG["WS_HEAD_STALE_SEC"] if fee[3] and HEADS.is_live(chain) else self.fee_ttl_sec
+            return time.time() - fee[2] >= ttl
+
+    def update_fee(self, chain: str, block_number: int, base_fee: int, pushed: bool = False):
+        with self._lock:
+            current = self._fees.get(chain)
+            if current is not None and current[0] > block_number:
+                return
+            self._fees[chain] = (block_number, base_fee, time.time(), pushed)
+
+    def base_fee(self, chain: str):
+        with self._lock:
+            fee = self._fees.get(chain)
+            return fee[1] if fee else None
+
+    def block_number(self, chain: str):
+        with self._lock:
+            fee = self._fees.get(chain)
+            return fee[0] if fee else None
+
+    def record_gas_estimate(self, from_chain: str, to_chain: str, estimated_gas: int) -> int:
+        route = (from_chain, to_chain)
+        with self._lock:
+            samples = self._gas_used.setdefault(route, deque(maxlen=self.window))
+            samples.append(estimated_gas)
+            return int(max(samples) * GAS_LIMIT_MULTIPLIER)
+
+GAS_ORACLE = GasOracle(CONFIG["FEE_CACHE_TTL_SEC"], CONFIG["GAS_LIMIT_WINDOW"])
+
+# ------------------- PREFLIGHT (BATCH JSON-RPC) ----------------------
+# Независимые чтения перед ордером (то, чего нет в кэшах: fee history, баланс, nonce, chain id)
+# уходят одним batch-запросом. Если провайдер batch не принимает — одиночные запросы.
+
+_chain_ids = {}
+_batch_unsupported = set()
+
+def _preflight_calls(w3, chain: str) -> list:
+    calls = []
+    if GAS_ORACLE.fee_is_stale(chain):
+        calls.append(("fee_history", lambda: w3.eth.fee_history(1, 'latest', [50])))
+    if BALANCE_TRACKER.is_stale(chain):
+        calls.append(("balance", lambda: w3.eth.get_balance(SENDER_ADDRESS)))
+    if not NONCE_MANAGER.is_seeded(chain):
+        calls.append(("pending", lambda: w3.eth.get_transaction_count(SENDER_ADDRESS, 'pending')))
+        calls.append(("latest", lambda: w3.eth.get_transaction_count(SENDER_ADDRESS, 'latest')))
+    if chain not in _chain_ids:
+        calls.append(("chain_id", lambda: w3.eth.chain_id))
+    return calls
+
+def _apply_preflight(chain: str, names: list, results: list) -> dict:
+    data = dict(zip(names, results))
+    if "pending" in data:
+        NONCE_MANAGER.seed(chain, data["pending"], data["latest"])
+    if "chain_id" in data:
+        _chain_ids[chain] = data["chain_id"]
+    if "balance" in data:
+        BALANCE_TRACKER.update(chain, data["balance"])
+    if "fee_history" in data:
+        # baseFeePerGas[-1] — base fee следующего блока после oldestBlock
+        GAS_ORACLE.update_fee(chain, data["fee_history"]['oldestBlock'], data["fee_history"]['baseFeePerGas'][-1])
+    return {
+        "balance": BALANCE_TRACKER.get(chain),
+        "base_fee": GAS_ORACLE.base_fee(chain),
+        "chain_id": _chain_ids[chain],
+    }
+
+def _batch_rejected(failure) -> bool:
+    # Провайдер именно отказал в batch: ответ не списком, -32600 или «batch not supported». Таймаут, 429
+    # и прочие сбои отдельного запроса к этому не относятся — такой батч просто повторяется одиночными
+    if isinstance(failure, BadResponseFormat):
+        return True
+    if isinstance(failure, Web3RPCError):
+        failure = failure.rpc_response
+    if not isinstance(failure, dict):
+        return False
+    error = failure.get("error")
+    if not isinstance(error, dict):
+        return error is None
+    message = str(error.get("message", "")).lower()
+    return error.get("code") == -32600 or "batch" in message and ("not supported" in message or "unsupported" in message)
+
+def _mark_batch_unsupported(chain: str, batch_error):
+    # Провайдер отверг batch — больше не пробуем
+    LOG.warning("batch_unsupported", chain=chain, error=batch_error)
+    _batch_unsupported.add(chain)
+
+def fetch_preflight(w3: Web3, chain: str) -> dict:
+    calls = _preflight_calls(w3, chain)
+    names = [name for name, _ in calls]
+    batch_error = None
+    if len(calls) > 1 and chain not in _batch_unsupported:
+        try:
+            with w3.batch_requests() as batch:
+                for _, call in calls:
+                    batch.add(call())
+                results = batch.execute()
+            return _apply_preflight(chain, names, results)
+        except Exception as e:
+            batch_error = e
+    results = [call() for _, call in calls]
+    if batch_error is not None and _batch_rejected(batch_error):
+        _mark_batch_unsupported(chain, batch_error)
+    return _apply_preflight(chain, names, results)
 
 # ------------------- CACHED ESTIMATES ----------------------
 
+ESTIMATE_URL = "https://api.t2rn.io/estimate"
+ESTIMATE_HEADERS = {"accept": "*/*", "content-type": "application/json"}
+
 _estimate_cache = {}
 _estimate_timestamps = {}
 _estimate_refresh_intervals = {}
 
-def fetch_estimated_amount_wei(from_chain: str, to_chain: str) -> int:
-    key = f"{from_chain}→{to_chain}"
-    now = time.time()
+ORDER_AMOUNT_WEI = 10**18  # базовый размер ордера; _estimate_cache хранит котировку именно для него
+
+def _estimate_payload(from_chain: str, to_chain: str, amount_wei: int = ORDER_AMOUNT_WEI) -> dict:
+    return {
+        "amountWei": str(amount_wei),
+        "executorTipUSD": 5,
+        "fromAsset": "eth",
+        "fromChain": from_chain,
+        "overpayOptionPercentage": 0,
+        "spreadOptionPercentage": 1,
+        "toAsset": "eth",
+        "toChain": to_chain
+    }
+
+def _estimate_needs_refresh(key: str, now: float) -> bool:
     last_time = _estimate_timestamps.get(key, 0)
     interval = _estimate_refresh_intervals.get(key, random.uniform(*CONFIG["ESTIMATE_REFRESH_INTERVAL_RANGE_SEC"]))
+    return now - last_time >= interval or key not in _estimate_cache
+
+def _parse_estimate(response_json: dict) -> int:
+    return int(response_json["estimatedReceivedAmountWei"]["hex"], 16)
+
+# Кривая котировок маршрута: received(amount) ≈ slope * amount - fee — спред пропорционален сумме,
+# комиссия исполнителя фиксирована. При ORDER_SIZE_FROM_BALANCE обновление после котировки ORDER_AMOUNT_WEI
+# в фоне досъёмывает суммы из QUOTE_GRID_ETH, любая сумма внутри сетки считается локально кусочно-линейной
+# интерполяцией по снятым точкам. max_error — наибольшее относительное отклонение точек от прямой: если API
+# отдаёт заметно нелинейную кривую, интерполяции не доверяем и котируем сумму точным запросом.
+
+class QuoteCurve:
+    def __init__(self, points: dict):
+        self.amounts = sorted(points)
+        self.received = [points[amount] for amount in self.amounts]
+        n = len(self.amounts)
+        mean_x = sum(self.amounts) / n
+        mean_y = sum(self.received) / n
+        var = sum((x - mean_x) ** 2 for x in self.amounts)
+        cov = sum((x - mean_x) * (y - mean_y) for x, y in zip(self.amounts, self.received))
+        self.slope = cov / var if var else mean_y / mean_x
+        self.fee = self.slope * mean_x - mean_y
+        self.max_error = max(abs(self.fit(x) - y) / y if y > 0 else float("inf")
+                             for x, y in zip(self.amounts, self.received))
+
+    def fit(self, amount_wei: int) -> float:
+        return self.slope * amount_wei - self.fee
+
+    def quote(self, amount_wei: int, max_error: float):
+        # None — сумма вне сетки или кривая слишком нелинейна
+        if not self.amounts[0] <= amount_wei <= self.amounts[-1] or self.max_error > max_error:
+            return None
+        i = bisect.bisect_left(self.amounts, amount_wei)
+        if self.amounts[i] == amount_wei:
+            return self.received[i]
+        x0, x1 = self.amounts[i - 1], self.amounts[i]
+        y0, y1 = self.received[i - 1], self.received[i]
+        return y0 + (y1 - y0) * (amount_wei - x0) // (x1 - x0)
+
+_quote_curves = {}
+
+def quote_grid_wei() -> list:
+    # Остальные точки кривой, кроме ORDER_AMOUNT_WEI; без ORDER_SIZE_FROM_BALANCE кривая не нужна
+    if not CONFIG["ORDER_SIZE_FROM_BALANCE"]:
+        return []
+    return sorted({Web3.to_wei(amount, 'ether') for amount in CONFIG["QUOTE_GRID_ETH"]} - {ORDER_AMOUNT_WEI})
+
+def _store_quote_curve(key: str, order_value: int, points: dict):
+    points[ORDER_AMOUNT_WEI] = order_value
+    _quote_curves[key] = QuoteCurve(points)
+
+def _store_estimate(key: str, value: int, now: float) -> int:
+    _estimate_cache[key] = value
+    _estimate_timestamps[key] = now
+    _estimate_refresh_intervals[key] = random.uniform(*CONFIG["ESTIMATE_REFRESH_INTERVAL_RANGE_SEC"])
+    JOURNAL.estimate(key, value, now)
+    return value
+
+def _estimate_fallback(key: str, e: Exception) -> int:
+    # estimate_error уже записан в _on_estimate_refresh_done
+    if key not in _estimate_cache:
+        raise e  # Если данных нет, прерываем
+    return _estimate_cache[key]
+
+def _cached_estimate(key: str) -> int:
+    return _fluctuate(_estimate_cache[key])
+
+def _fluctuate(value: int) -> int:
+    fluct_range = CONFIG["ESTIMATE_FLUCTUATION_PERCENT_RANGE"]
+    fluct = random.uniform(*fluct_range)
+    fluct *= -1 if random.random() < 0.5 else 1
+    value = int(value * (1 + fluct))
+    LOG.debug("estimate_cached", fluct_percent=fluct * 100)
+    return value
+
+# keep-alive сессия: не открываем новое соединение к api.t2rn.io на каждый запрос
+ESTIMATE_SESSION = requests.Session()
+ESTIMATE_SESSION.headers.update(ESTIMATE_HEADERS)
+ESTIMATE_LIMITER = get_rate_limiter("api.t2rn.io", CONFIG["ESTIMATE_RPS"], CONFIG["ESTIMATE_BURST"])
+
+_estimate_executor = ThreadPoolExecutor(max_workers=8, thread_name_prefix="estimate")
+_estimate_refreshing = {}  # маршрут → Future обновления, которое уже идёт
+_estimate_refreshing_lock = threading.Lock()
+
+def get_all_routes() -> list:
+    return [(src, dst) for src in get_all_sources() for dst in CONFIG["ALLOWED_ROUTES"][src]
+            if dst in CONFIG["ENABLED_CHAINS"] and ROUTE_BREAKER.allow(src, dst)]
+
+def request_quote(from_chain: str, to_chain: str, amount_wei: int) -> int:
+    ESTIMATE_LIMITER.acquire()
+    response = ESTIMATE_SESSION.post(ESTIMATE_URL, json=_estimate_payload(from_chain, to_chain, amount_wei), timeout=5)
+    if response.status_code == 429:
+        ESTIMATE_LIMITER.throttled(_retry_after(response.headers))
+    response.raise_for_status()
+    return _parse_estimate(response.json())
+
+def refresh_estimate(from_chain: str, to_chain: str) -> int:
+    # Сначала котировка для ORDER_AMOUNT_WEI — её ждёт отправка; остальная сетка — в фоне
+    key = f"{from_chain}→{to_chain}"
+    now = time.time()
+    LOG.info("estimate_refresh", route=key)
+    started = time.perf_counter()
+    try:
+        value = _store_estimate(key, request_quote(from_chain, to_chain, ORDER_AMOUNT_WEI), now)
+    except Exception:
+        METRICS.inc("anyarb_estimate_errors_total", route=key)
+        raise
+    finally:
+        METRICS.observe("anyarb_estimate_fetch_seconds", time.perf_counter() - started, route=key)
+    if quote_grid_wei():
+        _estimate_executor.submit(_refresh_quote_curve, from_chain, to_chain, value)
+    return value
 
-    if now - last_time >= interval or key not in _estimate_cache:
+def _refresh_quote_curve(from_chain: str, to_chain: str, order_value: int):
+    key = f"{from_chain}→{to_chain}"
+    try:
+        points = {amount: request_quote(from_chain, to_chain, amount) for amount in quote_grid_wei()}
+        _store_quote_curve(key, order_value, points)
+    except Exception as e:
+        METRICS.inc("anyarb_estimate_errors_total", route=key)
+        LOG.warning("estimate_error", route=key, error=e)
+
+def _on_estimate_refresh_done(key: str, future):
+    with _estimate_refreshing_lock:
+        if _estimate_refreshing.get(key) is future:
+            del _estimate_refreshing[key]
+    if future.exception() is not None:
+        LOG.warning("estimate_error", route=key, error=future.exception())
+
+def _refresh_estimate_in_background(from_chain: str, to_chain: str):
+    # Один запрос на маршрут: повторный вызов получает Future уже идущего обновления
+    key = f"{from_chain}→{to_chain}"
+    with _estimate_refreshing_lock:
+        future = _estimate_refreshing.get(key)
+        if future is not None:
+            return future
+        future = _estimate_executor.submit(refresh_estimate, from_chain, to_chain)
+        _estimate_refreshing[key] = future
+    # вне lock: у завершившегося Future колбэк вызывается сразу, в этом же потоке
+    future.add_done_callback(lambda f: _on_estimate_refresh_done(key, f))
+    return future
+
+def _local_quote(key: str, amount_wei: int):
+    curve = _quote_curves.get(key)
+    value = curve.quote(amount_wei, CONFIG["QUOTE_MAX_ERROR_PERCENT"] / 100) if curve else None
+    if value is None:
+        METRICS.inc("anyarb_quote_curve_misses_total", route=key)
+        return None
+    return _fluctuate(value)
+
+def fetch_estimated_amount_wei(from_chain: str, to_chain: str, amount_wei: int = ORDER_AMOUNT_WEI) -> int:
+    key = f"{from_chain}→{to_chain}"
+
+    if key not in _estimate_cache:
+        # Холодный старт: значения ещё нет, придётся подождать API — или уже идущее обновление маршрута
+        METRICS.inc("anyarb_estimate_cache_misses_total", route=key)
         try:
-            print(f"🌐 Обновление estimate {key} из API")
-            url = "https://api.t2rn.io/estimate"
-            payload = {
-                "amountWei": "1000000000000000000",
-                "executorTipUSD": 5,
-                "fromAsset": "eth",
-                "fromChain": from_chain,
-                "overpayOptionPercentage": 0,
-                "spreadOptionPercentage": 1,
-                "toAsset": "eth",
-                "toChain": to_chain
-            }
-            headers = {"accept": "*/*", "content-type": "application/json"}
-            response = requests.post(url, headers=headers, json=payload, timeout=5)
-            response.raise_for_status()
-            hex_value = response.json()["estimatedReceivedAmountWei"]["hex"]
-            value = int(hex_value, 16)
-            _estimate_cache[key] = value
-            _estimate_timestamps[key] = now
-            _estimate_refresh_intervals[key] = random.uniform(*CONFIG["ESTIMATE_REFRESH_INTERVAL_RANGE_SEC"])
+            value = _refresh_estimate_in_background(from_chain, to_chain).result()
         except Exception as e:
-            print(f"⚠️ Ошибка при получении estimate: {e}")
-            if key not in _estimate_cache:
-                raise e  # Если данных нет, прерываем
-            value = _estimate_cache[key]
+            value = _estimate_fallback(key, e)
+        if amount_wei == ORDER_AMOUNT_WEI:
+            return value
     else:
-        value = _estimate_cache[key]
-        fluct_range = CONFIG["ESTIMATE_FLUCTUATION_PERCENT_RANGE"]
-        fluct = random.uniform(*fluct_range)
-        fluct *= -1 if random.random() < 0.5 else 1
-        value = int(value * (1 + fluct))
-        print(f"♻️ Используется estimate из кэша с флуктуацией {fluct*100:.5f}%")
-
+        # stale-while-revalidate: отдаём последнее хорошее значение, обновление — в фоне
+        METRICS.inc("anyarb_estimate_cache_hits_total", route=key)
+        if _estimate_needs_refresh(key, time.time()):
+            _refresh_estimate_in_background(from_chain, to_chain)
+        if amount_wei == ORDER_AMOUNT_WEI:
+            return _cached_estimate(key)
+    value = _local_quote(key, amount_wei)
+    if value is None:
+        LOG.info("quote_off_curve", route=key, amount_wei=amount_wei)
+        value = request_quote(from_chain, to_chain, amount_wei)
     return value
 
+def _seconds_until_next_estimate_refresh(routes) -> float:
+    now = time.time()
+    waits = []
+    for from_chain, to_chain in routes:
+        key = f"{from_chain}→{to_chain}"
+        if key in _estimate_timestamps:
+            waits.append(_estimate_timestamps[key] + _estimate_refresh_intervals[key] - now)
+    return min(max(min(waits, default=1), 1), 30)
+
+def _route_due_for_refresh(key: str, now: float) -> bool:
+    # Фоново обновляем только маршруты, по которым estimate уже запрашивали: ещё не нужные плану не
+    # занимают ESTIMATE_RPS, их первый estimate запросит отправка
+    return key in _estimate_cache and _estimate_needs_refresh(key, now)
+
+def refresh_due_estimates() -> float:
+    # Один проход: устаревшие маршруты — на обновление в фоне; возвращает паузу до следующего прохода
+    routes = get_all_routes()
+    now = time.time()
+    for from_chain, to_chain in routes:
+        if _route_due_for_refresh(f"{from_chain}→{to_chain}", now):
+            _refresh_estimate_in_background(from_chain, to_chain)
+    return _seconds_until_next_estimate_refresh(routes)
+
 # ------------------- HELPERS ----------------------
 
 def encode_uint256(n: int) -> str:
@@ -141,89 +1447,505 @@ def build_submit_remote_order_data(sender: str, amount_wei: int, max_reward_wei:
         encode_uint256(max_reward_wei)
     )
 
-def parse_simulation_error(err: Exception) -> str:
-    msg = str(err)
-    if "execution reverted:" in msg:
-        start = msg.find("execution reverted:")
-        end = msg.find("',", start)
-        if end == -1:
-            end = len(msg)
-        return msg[start:end].strip("'\" ")
-    return msg
+# Быстрый кодировщик calldata: статичные слова маршрута (selector, сеть назначения, sender) собираются
+# один раз, на каждый ордер меняются только два uint256 — amount и max reward. Результат — сырые байты,
+# без hex-строк. build_submit_remote_order_data остаётся эталоном (см. bench/bench_encoder.py).
+
+SUBMIT_REMOTE_ORDER_AMOUNT_WORD = 3
+SUBMIT_REMOTE_ORDER_REWARD_WORD = 6
+
+class OrderCalldataTemplate:
+    def __init__(self, sender: str, chain_id_hex: str):
+        template = bytes.fromhex(build_submit_remote_order_data(sender, 0, 0, chain_id_hex)[2:])
+        amount_at = 4 + 32 * SUBMIT_REMOTE_ORDER_AMOUNT_WORD
+        reward_at = 4 + 32 * SUBMIT_REMOTE_ORDER_REWARD_WORD
+        self._head = template[:amount_at]
+        self._middle = template[amount_at + 32:reward_at]
+        self._tail = template[reward_at + 32:]
+
+    def encode(self, amount_wei: int, max_reward_wei: int) -> bytes:
+        return b"".join((self._head, amount_wei.to_bytes(32, "big"), self._middle,
+                         max_reward_wei.to_bytes(32, "big"), self._tail))
+
+_calldata_templates = {}
+
+def encode_order_calldata(sender: str, to_chain: str, amount_wei: int, max_reward_wei: int) -> bytes:
+    template = _calldata_templates.get((sender, to_chain))
+    if template is None:
+        template = _calldata_templates[(sender, to_chain)] = OrderCalldataTemplate(sender, to_chain.encode().hex())
+    return template.encode(amount_wei, max_reward_wei)
+
+# ------------------- REVERT DECODING ----------------------
+# Ошибка симуляции разбирается по revert data: Error(string), Panic(uint256) или custom error из таблицы
+# селекторов. persistent — маршрут с такими параметрами не пройдёт и при повторе (пауза, лимиты, устаревший
+# estimate), transient — проблема момента. Ошибки узла/RPC без реверта (таймаут, nonce, газ, баланс на газ)
+# — transient. Всё, чем откатился контракт, — persistent, кроме явно перечисленных причин: повторять такие
+# реверты бессмысленно, а из ротации маршрут всё равно выводится только после нескольких подряд.
+
+ERROR_STRING_SELECTOR = "0x08c379a0"
+PANIC_SELECTOR = "0x4e487b71"
+
+# Custom errors контракта: сигнатура -> kind. Селекторы берутся только из ABI контракта ордеров; ABI в
+# репозитории нет, поэтому таблица пуста — неизвестный селектор разбирается как persistent
+KNOWN_CUSTOM_ERRORS = {}
+CUSTOM_ERROR_SELECTORS = {"0x" + bytes(Web3.keccak(text=sig)[:4]).hex(): (sig, kind) for sig, kind in KNOWN_CUSTOM_ERRORS.items()}
+
+# Причины реверта (Error(string) или текст после "execution reverted"), которые известно что временные
+TRANSIENT_REVERT_REASONS = ("reentrancyguard: reentrant call",)
+
+def _revert_data(err: Exception):
+    data = getattr(err, "data", None)
+    if data is None and err.args and isinstance(err.args[0], dict):
+        data = err.args[0].get("data")
+    if isinstance(data, dict):
+        data = data.get("data")
+    if isinstance(data, str):
+        data = data.split(" ")[-1]  # "Reverted 0x..."
+        if data.startswith("0x") and len(data) >= 10:
+            return data.lower()
+    return None
 
-def send_remote_order_tx(w3: Web3, from_chain: str, to_chain: str) -> bool:
+def _classify_revert_reason(reason: str) -> str:
+    return "transient" if reason.strip().lower() in TRANSIENT_REVERT_REASONS else "persistent"
+
+def decode_simulation_error(err: Exception) -> dict:
+    # {"kind": "persistent" | "transient", "reason": str}
+    data = _revert_data(err)
+    if data is None:
+        message = getattr(err, "message", None) or str(err)  # str() исключений web3 — repr кортежа аргументов
+        if isinstance(err, ContractLogicError) or "execution reverted" in message:
+            reason = message[message.find("execution reverted"):] if "execution reverted" in message else message
+            reason = reason.strip("'\" }")
+            text = reason.partition("execution reverted")[2].lstrip(": ")
+            return {"kind": _classify_revert_reason(text), "reason": reason}
+        # Ошибка узла/RPC, а не реверт контракта
+        return {"kind": "transient", "reason": message}
+    selector = data[:10]
+    if selector == ERROR_STRING_SELECTOR:
+        try:
+            reason = abi_decode(["string"], bytes.fromhex(data[10:]))[0]
+        except Exception:
+            reason = data
+        return {"kind": _classify_revert_reason(reason), "reason": f"Error({reason!r})"}
+    if selector == PANIC_SELECTOR:
+        return {"kind": "persistent", "reason": f"Panic(0x{data[-2:]})"}
+    signature, kind = CUSTOM_ERROR_SELECTORS.get(selector, (f"unknown error {selector}", "persistent"))
+    return {"kind": kind, "reason": signature}
+
+# ------------------- ROUTE CIRCUIT BREAKER ----------------------
+# BREAKER_FAILURE_THRESHOLD persistent-ревертов подряд на маршруте — маршрут выпадает из планировщика,
+# случайного выбора и фонового обновления estimate на BREAKER_COOLDOWN_SEC. После паузы маршрут снова
+# доступен: первая попытка — проба. Успешная симуляция закрывает breaker, новый persistent-реверт
+# открывает его снова с удвоенной паузой. Transient-ошибки breaker не трогают.
+
+class RouteBreaker:
+    def __init__(self, threshold: int, cooldown_sec: float, max_cooldown_sec: float):
+        self.threshold = threshold
+        self.cooldown_sec = cooldown_sec
+        self.max_cooldown_sec = max_cooldown_sec
+        self._lock = threading.Lock()
+        self._failures = {}    # route -> persistent-ревертов подряд
+        self._open_until = {}  # route -> до какого времени маршрут выключен
+        self._cooldown = {}    # route -> текущая пауза (растёт при неудачных пробах)
+
+    def allow(self, from_chain: str, to_chain: str) -> bool:
+        with self._lock:
+            return time.time() >= self._open_until.get((from_chain, to_chain), 0)
+
+    def reopened_since(self, since: float) -> bool:
+        # Истекла ли пауза какого-то маршрута после момента since — план стоит перестроить с ним
+        now = time.time()
+        with self._lock:
+            return any(since < until <= now for until in self._open_until.values())
+
+    def record_success(self, from_chain: str, to_chain: str):
+        route = (from_chain, to_chain)
+        with self._lock:
+            self._failures.pop(route, None)
+            was_open = self._cooldown.pop(route, None) is not None
+            self._open_until.pop(route, None)
+        if was_open:
+            LOG.info("route_restored", from_chain=from_chain, to_chain=to_chain)
+
+    def record_failure(self, from_chain: str, to_chain: str, kind: str):
+        if kind != "persistent":
+            return
+        route = (from_chain, to_chain)
+        with self._lock:
+            failures = self._failures[route] = self._failures.get(route, 0) + 1
+            probing = route in self._cooldown
+            if not probing and failures < self.threshold:
+                return
+            cooldown = min(self._cooldown[route] * 2, self.max_cooldown_sec) if probing else self.cooldown_sec
+            self._cooldown[route] = cooldown
+            self._open_until[route] = time.time() + cooldown
+        METRICS.inc("anyarb_route_breaker_trips_total", route=f"{from_chain}→{to_chain}")
+        LOG.warning("route_tripped", from_chain=from_chain, to_chain=to_chain, failures=failures, cooldown_sec=cooldown)
+        ROUTE_PLANNER.invalidate()
+
+ROUTE_BREAKER = RouteBreaker(CONFIG["BREAKER_FAILURE_THRESHOLD"], CONFIG["BREAKER_COOLDOWN_SEC"],
+                             CONFIG["BREAKER_MAX_COOLDOWN_SEC"])
+
+# ------------------- SIMULATION CACHE ----------------------
+# eth_estimateGas исполняет тот же вызов, что и eth_call, и откатывается с той же revert data — одна
+# симуляция даёт и gas limit, и проверку на revert. Исход одинаков для всех ордеров маршрута близкого
+# размера в одном блоке, поэтому кэшируется по (сеть, маршрут, корзина суммы, блок): следующие ордера
+# блока берут gas limit прошедшей симуляции, а после revert сразу пропускаются без RPC. Ошибки RPC
+# (не revert) не кэшируются. Номер блока — из GAS_ORACLE (newHeads или fee history).
+
+class SimulationCache:
+    def __init__(self, bucket_eth: float, ttl_sec: float):
+        self.bucket_wei = Web3.to_wei(bucket_eth, 'ether')
+        self.ttl_sec = ttl_sec
+        self._lock = threading.Lock()
+        self._results = {}  # (from_chain, to_chain, bucket, block) -> (ok, gas_limit | revert, stored_at)
+
+    def key(self, from_chain: str, to_chain: str, amount_wei: int):
+        block = GAS_ORACLE.block_number(from_chain)
+        if block is None or self.bucket_wei <= 0 or self.ttl_sec <= 0:
+            return None
+        return from_chain, to_chain, amount_wei // self.bucket_wei, block
+
+    def get(self, key):
+        if key is None:
+            return None
+        with self._lock:
+            entry = self._results.get(key)
+            if entry is None or time.time() - entry[2] >= self.ttl_sec:
+                return None
+            return entry
+
+    def put(self, key, ok: bool, value):
+        if key is None:
+            return
+        with self._lock:
+            self._results[key] = (ok, value, time.time())
+            # Исходы прошлых блоков сети больше не понадобятся
+            for old in [k for k in self._results if k[0] == key[0] and k[3] < key[3]]:
+                del self._results[old]
+
+SIMULATIONS = SimulationCache(CONFIG["SIMULATION_AMOUNT_BUCKET_ETH"], CONFIG["SIMULATION_CACHE_TTL_SEC"])
+
+def _simulation_tx(tx: dict) -> dict:
+    # Без gas: узел сам ищет лимит, иначе оценка упрётся в предварительный FALLBACK_GAS_LIMIT
+    return {k: v for k, v in tx.items() if k != 'gas'}
+
+def _cached_simulation(from_chain: str, to_chain: str, key):
+    entry = SIMULATIONS.get(key)
+    route = f"{from_chain}→{to_chain}"
+    METRICS.inc("anyarb_simulation_cache_hits_total" if entry else "anyarb_simulation_cache_misses_total", route=route)
+    if entry is None:
+        return None
+    return (entry[1], None) if entry[0] else (None, entry[1])
+
+def _simulation_passed(from_chain: str, to_chain: str, key, estimated_gas: int) -> tuple:
+    gas_limit = GAS_ORACLE.record_gas_estimate(from_chain, to_chain, estimated_gas)
+    SIMULATIONS.put(key, True, gas_limit)
+    ROUTE_BREAKER.record_success(from_chain, to_chain)
+    return gas_limit, None
+
+def _simulation_failed(from_chain: str, to_chain: str, key, err: Exception) -> tuple:
+    revert = decode_simulation_error(err)
+    if isinstance(err, ContractLogicError):
+        SIMULATIONS.put(key, False, revert)
+    ROUTE_BREAKER.record_failure(from_chain, to_chain, revert["kind"])
+    return None, revert
+
+def simulate_order(w3: Web3, from_chain: str, to_chain: str, tx: dict) -> tuple:
+    # (gas_limit, None) — симуляция прошла, (None, revert) — ордер откатится
+    key = SIMULATIONS.key(from_chain, to_chain, tx['value'])
+    cached = _cached_simulation(from_chain, to_chain, key)
+    if cached is not None:
+        return cached
     try:
-        to_address = TO_ADDRESSES[from_chain]
-        sender = SENDER_ADDRESS
-
-        balance_wei = w3.eth.get_balance(sender)
-        balance_eth = w3.from_wei(balance_wei, 'ether')
-        print(f"💰 [{from_chain.upper()}] Баланс: {balance_eth:.4f} ETH")
-        if balance_eth < CONFIG["MIN_BALANCE_TO_SEND"]:
-            print(f"⚠️  Недостаточный баланс (< {CONFIG['MIN_BALANCE_TO_SEND']} ETH). Пропуск.")
-            return False
+        estimated_gas = w3.eth.estimate_gas(_simulation_tx(tx), 'latest')
+    except Exception as e:
+        return _simulation_failed(from_chain, to_chain, key, e)
+    return _simulation_passed(from_chain, to_chain, key, estimated_gas)
+
+async def simulate_order_async(w3: AsyncWeb3, from_chain: str, to_chain: str, tx: dict) -> tuple:
+    key = SIMULATIONS.key(from_chain, to_chain, tx['value'])
+    cached = _cached_simulation(from_chain, to_chain, key)
+    if cached is not None:
+        return cached
+    try:
+        estimated_gas = await w3.eth.estimate_gas(_simulation_tx(tx), 'latest')
+    except Exception as e:
+        return _simulation_failed(from_chain, to_chain, key, e)
+    return _simulation_passed(from_chain, to_chain, key, estimated_gas)
+
+def order_amount_wei(balance_wei: int) -> int:
+    # Размер ордера: 1 ETH или доля баланса source-сети в пределах [ORDER_MIN_ETH, ORDER_MAX_ETH],
+    # округлённая до 0.01 ETH. 0 — баланса не хватает даже на минимальный ордер с запасом на газ
+    if not CONFIG["ORDER_SIZE_FROM_BALANCE"]:
+        return ORDER_AMOUNT_WEI
+    spendable = balance_wei - Web3.to_wei(ORDER_GAS_RESERVE_ETH, 'ether')
+    amount = min(int(balance_wei * CONFIG["ORDER_BALANCE_FRACTION"]), Web3.to_wei(CONFIG["ORDER_MAX_ETH"], 'ether'), spendable)
+    amount -= amount % 10**16
+    return amount if amount >= Web3.to_wei(CONFIG["ORDER_MIN_ETH"], 'ether') else 0
+
+def build_order_tx_common(from_chain: str, to_chain: str, estimated_amount: int,
+                          amount_wei: int = ORDER_AMOUNT_WEI) -> dict:
+    calldata = encode_order_calldata(SENDER_ADDRESS, to_chain, estimated_amount, amount_wei)
+    return {
+        'from': SENDER_ADDRESS,
+        'to': TO_ADDRESSES[from_chain],
+        'value': amount_wei,
+        'data': calldata,
+    }
 
-        estimated_amount = fetch_estimated_amount_wei(from_chain, to_chain)
-        calldata = build_submit_remote_order_data(sender, estimated_amount, 10**18, chain_id_hex=to_chain.encode().hex())
+def finalize_order_tx(tx_common: dict, gas_limit: int, base_fee: int, chain_id: int, nonce: int) -> dict:
+    priority_fee = Web3.to_wei(1, 'gwei')
+    return {
+        **tx_common,
+        'gas': gas_limit,
+        'maxFeePerGas': base_fee + priority_fee * 2,
+        'maxPriorityFeePerGas': priority_fee,
+        'type': 2,
+        'chainId': chain_id,
+        'nonce': nonce
+    }
 
-        nonce = w3.eth.get_transaction_count(sender)
+def order_max_cost_wei(tx: dict) -> int:
+    return tx['value'] + tx['gas'] * tx['maxFeePerGas']
+
+def handle_send_failure(from_chain: str, nonce, e: Exception, broadcast: bool = False):
+    # broadcast — ошибка после send_raw_transaction (таймаут, обрыв соединения): TX могла уже попасть в
+    # мемпул, и повторная выдача этого nonce заменила бы или задвоила ордер. Такой nonce не возвращаем,
+    # а перечитываем счётчик из pending; возвращается только nonce ордера, который не дошёл до отправки
+    LOG.error("send_failed", chain=from_chain, nonce=nonce, error=e)
+    if nonce is not None:
+        if broadcast or is_nonce_error(e):
+            LOG.warning("nonce_resync", chain=from_chain)
+            PRESIGNED_ORDERS.drop(from_chain)
+            NONCE_MANAGER.resync(from_chain)
+        else:
+            NONCE_MANAGER.release(from_chain, nonce)
 
-        fee_history = w3.eth.fee_history(1, 'latest', [50])
-        base_fee = fee_history['baseFeePerGas'][-1]
-        priority_fee = w3.to_wei(1, 'gwei')
-        max_fee_per_gas = base_fee + priority_fee * 2
+def prepare_order(w3: Web3, from_chain: str, to_chain: str):
+    # Всё до broadcast: preflight, estimate, nonce, газ, симуляция и подпись. None — ордер не собран
+    nonce = None
+    timer = OrderTimer(from_chain, to_chain)
+    try:
+        preflight = fetch_preflight(w3, from_chain)
+        timer.lap("preflight")
+        LOG.debug("balance", chain=from_chain, balance_wei=preflight["balance"])
+        if preflight["balance"] < Web3.to_wei(CONFIG["MIN_BALANCE_TO_SEND"], 'ether'):
+            LOG.info("skip_low_balance", chain=from_chain, min_eth=CONFIG["MIN_BALANCE_TO_SEND"])
+            timer.finish("skipped")
+            return None
+
+        amount_wei = order_amount_wei(preflight["balance"])
+        if amount_wei == 0:
+            LOG.info("skip_small_order", chain=from_chain, min_eth=CONFIG["ORDER_MIN_ETH"])
+            timer.finish("skipped")
+            return None
+
+        estimated_amount = fetch_estimated_amount_wei(from_chain, to_chain, amount_wei)
+        timer.lap("estimate")
+        tx_common = build_order_tx_common(from_chain, to_chain, estimated_amount, amount_wei)
+
+        nonce = allocate_nonce(w3, from_chain)
+        timer.lap("nonce")
+        if nonce is None:
+            LOG.info("skip_inflight", chain=from_chain, inflight=NONCE_MANAGER.max_inflight)
+            timer.finish("skipped")
+            return None
+
+        tx = finalize_order_tx(tx_common, FALLBACK_GAS_LIMIT, preflight["base_fee"], preflight["chain_id"], nonce)
+        gas_limit, revert = simulate_order(w3, from_chain, to_chain, tx)
+        timer.lap("simulate")
+        if revert is not None:
+            LOG.warning("sim_reverted", from_chain=from_chain, to_chain=to_chain, nonce=nonce,
+                        reason=revert["reason"], kind=revert["kind"])
+            NONCE_MANAGER.release(from_chain, nonce)
+            timer.finish("sim_reverted")
+            return None
+        tx['gas'] = gas_limit
+
+        signed_tx = sign_order_tx(tx)
+        timer.lap("sign")
+        return make_prepared_order(from_chain, to_chain, tx, signed_tx, timer)
 
-        tx_common = {
-            'from': sender,
-            'to': to_address,
-            'value': w3.to_wei(1, 'ether'),
-            'data': calldata,
-        }
+    except Exception as e:
+        handle_send_failure(from_chain, nonce, e)
+        timer.finish("failed")
+        return None
 
-        try:
-            estimated_gas = w3.eth.estimate_gas(tx_common)
-            gas_limit = int(estimated_gas * 1.1)
-        except Exception:
-            print(f"⚠️ Оценка газа не удалась. Использую gas_limit = 110000.")
-            gas_limit = 110_000
-
-        tx = {
-            **tx_common,
-            'gas': gas_limit,
-            'maxFeePerGas': max_fee_per_gas,
-            'maxPriorityFeePerGas': priority_fee,
-            'type': 2,
-            'chainId': w3.eth.chain_id,
-            'nonce': nonce
-        }
+def broadcast_order(w3: Web3, order: dict) -> bool:
+    from_chain, to_chain, timer = order["from_chain"], order["to_chain"], order["timer"]
+    try:
+        timer.resume()
+        tx_hash = w3.eth.send_raw_transaction(order["raw_tx"])
+        timer.lap("broadcast")
+        BALANCE_TRACKER.debit(from_chain, order_max_cost_wei(order["tx"]))
+        RECEIPT_TRACKER.track(from_chain, w3.to_hex(tx_hash), to_chain, order["nonce"], tx=order["tx"])
+        JOURNAL.order_sent(from_chain, to_chain, order["nonce"], w3.to_hex(tx_hash), order["tx"]['value'])
+
+        LOG.info("order_sent", from_chain=from_chain, to_chain=to_chain, nonce=order["nonce"],
+                 tx_hash=w3.to_hex(tx_hash), value_wei=order["tx"]['value'])
+        AIMD.on_success()
+        timer.finish("sent")
+        return True
 
-        try:
-            w3.eth.call(tx, 'latest')
-        except Exception as call_error:
-            parsed_err = parse_simulation_error(call_error)
-            print(f"🚫 [{from_chain.upper()} → {to_chain.upper()}] Транзакция отклонена при симуляции: ({parsed_err})")
-            return False
+    except Exception as e:
+        handle_send_failure(from_chain, order["nonce"], e, broadcast=True)
+        timer.finish("failed")
+        return False
 
-        signed_tx = w3.eth.account.sign_transaction(tx, private_key=PRIVATE_KEY)
-        tx_hash = w3.eth.send_raw_transaction(signed_tx.raw_transaction)
+def send_remote_order_tx(w3: Web3, from_chain: str, to_chain: str) -> bool:
+    order = prepare_order(w3, from_chain, to_chain)
+    return order is not None and broadcast_order(w3, order)
+
+# ------------------- SIGNING / PRESIGNED ORDERS ----------------------
+# Подпись — CPU-bound ECDSA, в асинхронном режиме она уходит в пул потоков. С PRESIGN_ORDERS_PER_CHAIN > 0
+# следующие ордера собираются, симулируются и подписываются заранее (nonce и fee из кэшей), и в момент
+# отправки остаётся один RPC — send_raw_transaction.
+
+SIGNING_EXECUTOR = ThreadPoolExecutor(max_workers=CONFIG["SIGNING_WORKERS"], thread_name_prefix="signer")
+
+def sign_order_tx(tx: dict):
+    return ACCOUNT.sign_transaction(tx)
+
+async def sign_order_tx_async(tx: dict):
+    return await asyncio.get_running_loop().run_in_executor(SIGNING_EXECUTOR, ACCOUNT.sign_transaction, tx)
+
+def make_prepared_order(from_chain: str, to_chain: str, tx: dict, signed_tx, timer) -> dict:
+    return {
+        "from_chain": from_chain,
+        "to_chain": to_chain,
+        "nonce": tx['nonce'],
+        "tx": tx,
+        "raw_tx": signed_tx.raw_transaction,
+        "prepared_at": time.time(),
+        "timer": timer,
+    }
 
-        print(f"✅ [{from_chain.upper()} → {to_chain.upper()}] TX отправлена: {w3.to_hex(tx_hash)}")
-        return True
+class PresignedOrders:
+    def __init__(self, max_age_sec: float):
+        self.max_age_sec = max_age_sec
+        self._lock = threading.Lock()
+        self._orders = []  # в порядке подготовки (и выдачи nonce)
+
+    def put(self, order: dict):
+        with self._lock:
+            self._orders.append(order)
+
+    def count(self, chain: str = None) -> int:
+        with self._lock:
+            return sum(1 for o in self._orders if chain is None or o["from_chain"] == chain)
+
+    def nonces(self, chain: str) -> set:
+        with self._lock:
+            return {o["nonce"] for o in self._orders if o["from_chain"] == chain}
+
+    def _is_stale(self, order: dict) -> bool:
+        if time.time() - order["prepared_at"] > self.max_age_sec:
+            return True
+        # base fee вырос выше того, что готова платить подписанная TX
+        base_fee = GAS_ORACLE.base_fee(order["from_chain"])
+        tx = order["tx"]
+        return base_fee is not None and base_fee > tx['maxFeePerGas'] - tx['maxPriorityFeePerGas']
+
+    def take(self, chain: str = None):
+        # Самый ранний готовый ордер сети (или любой сети). Если он протух — сбрасываем всю очередь сети,
+        # чтобы не оставить дыр в nonce за ним
+        with self._lock:
+            order = next((o for o in self._orders if chain is None or o["from_chain"] == chain), None)
+            if order is None:
+                return None
+            if not self._is_stale(order):
+                self._orders.remove(order)
+                return order
+        for dropped in sorted(self.drop(order["from_chain"]), key=lambda o: o["nonce"], reverse=True):
+            NONCE_MANAGER.release(dropped["from_chain"], dropped["nonce"])
+        LOG.info("presigned_expired", chain=order["from_chain"])
+        return None
 
+    def drop(self, chain: str) -> list:
+        with self._lock:
+            dropped = [o for o in self._orders if o["from_chain"] == chain]
+            self._orders = [o for o in self._orders if o["from_chain"] != chain]
+        return dropped
+
+PRESIGNED_ORDERS = PresignedOrders(CONFIG["PRESIGN_MAX_AGE_SEC"])
+
+def presign_orders(limit: int, source: str = None):
+    # Пока сеть ждёт задержку, готовим её следующие ордера (source=None — по общему плану маршрутов)
+    while PRESIGNED_ORDERS.count(source) < limit:
+        route = select_route() if source is None else (source, select_target(source))
+        if route is None or route[1] is None:
+            return
+        src, target = route
+        order = prepare_order(WEB3_INSTANCES[src], src, target)
+        if order is None:
+            return
+        PRESIGNED_ORDERS.put(order)
+
+# ------------------- BALANCE TRACKER ----------------------
+# Один снимок баланса на сеть с TTL. После каждой отправленной TX снимок уменьшается локально
+# (value + максимальная стоимость газа), RPC читается только при устаревании или фоновым обновлением.
+
+class BalanceTracker:
+    def __init__(self, ttl_sec: float):
+        self.ttl_sec = ttl_sec
+        self._lock = threading.Lock()
+        self._balances = {}
+        self._updated = {}
+        self.version = 0  # растёт при каждом чтении из RPC (локальные списания не в счёт)
+
+    def is_stale(self, chain: str) -> bool:
+        with self._lock:
+            return time.time() - self._updated.get(chain, 0) >= self.ttl_sec
+
+    def stale_chains(self, chains) -> list:
+        return [c for c in chains if self.is_stale(c)]
+
+    def get(self, chain: str):
+        with self._lock:
+            return self._balances.get(chain)
+
+    def update(self, chain: str, balance_wei: int):
+        with self._lock:
+            self._balances[chain] = balance_wei
+            self._updated[chain] = time.time()
+            self.version += 1
+
+    def debit(self, chain: str, amount_wei: int):
+        with self._lock:
+            if chain in self._balances:
+                self._balances[chain] = max(0, self._balances[chain] - amount_wei)
+
+    def invalidate(self, chain: str):
+        # Например, на новом блоке — следующее чтение пойдёт в RPC
+        with self._lock:
+            self._updated.pop(chain, None)
+
+BALANCE_TRACKER = BalanceTracker(CONFIG["BALANCE_TTL_SEC"])
+
+def get_enabled_chains():
+    return [c for c in WEB3_INSTANCES if c in CONFIG["ENABLED_CHAINS"] and READINESS.is_ready(c)]
+
+def refresh_balances(chains, force: bool = False):
+    for chain in (chains if force else BALANCE_TRACKER.stale_chains(chains)):
+        BALANCE_TRACKER.update(chain, WEB3_INSTANCES[chain].eth.get_balance(SENDER_ADDRESS))
+
+def get_balance_eth(chain: str):
+    refresh_balances([chain])
+    return Web3.from_wei(BALANCE_TRACKER.get(chain), 'ether')
+
+def refresh_polled_balances():
+    try:
+        refresh_balances(HEADS.polled_chains(get_enabled_chains()), force=True)
     except Exception as e:
-        print(f"❌ [{from_chain.upper()}] Ошибка при отправке TX: {e}")
-        return False
+        LOG.warning("balance_refresh_error", error=e)
 
 # ------------------- BALANCE CHECKS ----------------------
 
 def get_low_balance_chains():
     low_balance = []
-    for chain, w3 in WEB3_INSTANCES.items():
-        if chain not in CONFIG["ENABLED_CHAINS"]:
-            continue
-        bal = w3.eth.get_balance(SENDER_ADDRESS)
-        eth_bal = w3.from_wei(bal, 'ether')
-        if eth_bal < CONFIG["THRESHOLD_ETH"]:
+    for chain in get_enabled_chains():
+        if get_balance_eth(chain) < CONFIG["THRESHOLD_ETH"]:
             low_balance.append(chain)
     return low_balance
 
@@ -231,9 +1953,7 @@ def choose_source_chain(all_sources):
     high_balance_chains = []
     normal_chains = []
     for c in all_sources:
-        bal = WEB3_INSTANCES[c].eth.get_balance(SENDER_ADDRESS)
-        eth_bal = WEB3_INSTANCES[c].from_wei(bal, 'ether')
-        if eth_bal > HIGH_BALANCE_THRESHOLD:
+        if get_balance_eth(c) > HIGH_BALANCE_THRESHOLD:
             high_balance_chains.append(c)
         else:
             normal_chains.append(c)
@@ -244,14 +1964,639 @@ def choose_source_chain(all_sources):
         return random.choice(normal_chains)
     return random.choice(all_sources)
 
+def get_configured_sources():
+    return [c for c in CONFIG["ALLOWED_ROUTES"].keys() if c in CONFIG["ENABLED_CHAINS"]]
+
+def get_all_sources():
+    return [c for c in get_configured_sources() if READINESS.is_ready(c)]
+
+def choose_targets_for_source(source, low_priority_targets):
+    all_sources = get_all_sources()
+    target_candidates = low_priority_targets if low_priority_targets else list(set(
+        t for src in all_sources for t in CONFIG["ALLOWED_ROUTES"][src]
+    ) & set(CONFIG["ENABLED_CHAINS"]))
+
+    allowed_targets_for_source = [t for t in CONFIG["ALLOWED_ROUTES"].get(source, [])
+                                  if t in CONFIG["ENABLED_CHAINS"] and ROUTE_BREAKER.allow(source, t)]
+
+    # Фильтруем allowed_targets_for_source так, чтобы они совпадали с target_candidates,
+    # либо если target_candidates пусты — берём все разрешённые
+    targets = [t for t in allowed_targets_for_source if t in target_candidates]
+    if not targets:
+        targets = allowed_targets_for_source
+    return targets
+
+def next_delay_sec(success: bool) -> float:
+    delay_sec = random.uniform(*CONFIG["DELAY_RANGE"])
+    if success:
+        delay_sec *= CONFIG["SUCCESS_DELAY_MULTIPLIER"]
+    else:
+        delay_sec *= CONFIG["FAILURE_DELAY_MULTIPLIER"]
+    return delay_sec
+
 def check_balances():
-    print("\n🔍 Проверка балансов...")
-    for chain, w3 in WEB3_INSTANCES.items():
-        if chain not in CONFIG["ENABLED_CHAINS"]:
-            continue
-        balance = w3.eth.get_balance(SENDER_ADDRESS)
-        eth_balance = w3.from_wei(balance, 'ether')
-        print(f"   - {chain.upper()}: {eth_balance:.4f} ETH")
+    chains = get_enabled_chains()
+    refresh_balances(chains)
+    log_balances(chains)
+
+# ------------------- ROUTE PLANNER ----------------------
+# Жадно проигрывает следующие PLANNER_HORIZON_ORDERS ордеров на копии балансов раундами: в каждом раунде
+# каждая сеть-источник с запасом над MIN_BALANCE_TO_SEND (воркеры сетей отправляют параллельно) шлёт
+# ордер реального размера (order_amount_wei) в самую «голодную» из разрешённых целей (запас считается
+# от MIN_BALANCE_TO_SEND для сетей-источников и от THRESHOLD_ETH для остальных), так что средства
+# крутятся между источниками и не застревают в одной сети.
+# Результат — таблица маршрутов, выбор следующего маршрута — O(1). План перестраивается, когда он
+# закончился или реальные балансы ушли от прогноза больше чем на PLANNER_REPLAN_DELTA_ETH.
+
+ORDER_GAS_RESERVE_ETH = 0.001
+
+def _route_received_ratio(from_chain: str, to_chain: str) -> float:
+    estimate = _estimate_cache.get(f"{from_chain}→{to_chain}")
+    return estimate / 10**18 if estimate else 0.99
+
+def _planner_routes(balances: dict) -> dict:
+    return {src: [t for t in CONFIG["ALLOWED_ROUTES"][src] if t in balances and ROUTE_BREAKER.allow(src, t)]
+            for src in CONFIG["ALLOWED_ROUTES"] if src in balances}
+
+def _headroom(chain: str, bal: dict, routes: dict) -> float:
+    floor = CONFIG["MIN_BALANCE_TO_SEND"] if chain in routes else CONFIG["THRESHOLD_ETH"]
+    return bal[chain] - floor
+
+def _plan_step(bal: dict, routes: dict, source: str):
+    # Следующий ордер source-сети по балансам bal: (target, сумма в ETH) или None, если ей нечего отправлять
+    amount = order_amount_wei(int(bal[source] * 10**18)) / 10**18
+    if not routes.get(source) or not amount or bal[source] - amount - ORDER_GAS_RESERVE_ETH < CONFIG["MIN_BALANCE_TO_SEND"]:
+        return None
+    # Сеть без исходящих маршрутов дальше деньги не отправит — доливаем её только до THRESHOLD_ETH
+    target = min(routes[source], key=lambda c: (c not in routes and _headroom(c, bal, routes) >= 0,
+                                                _headroom(c, bal, routes), c))
+    return target, amount
+
+def _apply_step(bal: dict, source: str, target: str, amount: float):
+    bal[source] -= amount + ORDER_GAS_RESERVE_ETH
+    bal[target] += amount * _route_received_ratio(source, target)
+
+def build_route_plan(balances: dict, horizon: int):
+    # expected[i] — прогноз балансов перед i-м ордером плана, expected[-1] — после всего плана
+    routes = _planner_routes(balances)
+    bal = dict(balances)
+    plan, expected = [], []
+    while len(plan) < horizon:
+        planned = len(plan)
+        for source in sorted(routes, key=lambda c: (-_headroom(c, bal, routes), c)):
+            step = _plan_step(bal, routes, source)
+            if step is None:
+                continue
+            expected.append(dict(bal))
+            plan.append((source, step[0]))
+            _apply_step(bal, source, *step)
+            if len(plan) == horizon:
+                break
+        if len(plan) == planned:
+            break
+    expected.append(dict(bal))
+    return plan, expected
+
+class RoutePlanner:
+    # План строится раз на горизонт и раздаётся по очередям source-сетей: выбор цели — O(1), план
+    # перестраивается только когда он исчерпан или реальные балансы заметно ушли от прогноза.
+    def __init__(self, horizon: int, replan_delta_eth: float):
+        self.horizon = horizon
+        self.replan_delta_eth = replan_delta_eth
+        self._lock = threading.Lock()
+        self._plan = []
+        self._expected = []
+        self._projected = {}
+        self._by_source = {}
+        self._remaining = 0
+        self._version = None
+        self._planned_at = 0.0
+
+    def needs_replan(self, balances: dict, version: int) -> bool:
+        if ROUTE_BREAKER.reopened_since(self._planned_at):
+            return True
+        with self._lock:
+            if not self._remaining:
+                return True
+            if version == self._version:
+                return False
+            # Прогноз с учётом уже выданных ордеров, в каком бы порядке их ни забирали source-сети
+            expected = self._projected
+            if any(abs(balances[c] - expected.get(c, balances[c])) > self.replan_delta_eth for c in balances):
+                return True
+            self._version = version  # прогноз подтвердился — продолжаем по текущему плану
+            return False
+
+    def replan(self, balances: dict, version: int):
+        plan, expected = build_route_plan(balances, self.horizon)
+        by_source = {}
+        for i, (source, _) in enumerate(plan):
+            by_source.setdefault(source, deque()).append(i)
+        with self._lock:
+            self._planned_at = time.time()
+            self._plan, self._expected = plan, expected
+            self._projected = dict(expected[0])
+            self._by_source = by_source
+            self._remaining = len(plan)
+            self._version = version
+        if plan:
+            counts = {}
+            for route in plan:
+                counts[route] = counts.get(route, 0) + 1
+            summary = ", ".join(f"{s.upper()}→{t.upper()}×{n}" for (s, t), n in sorted(counts.items()))
+            LOG.info("plan_built", orders=len(plan), summary=summary)
+        else:
+            LOG.warning("plan_empty")
+
+    def invalidate(self):
+        # Следующий запрос маршрута перестроит план (например, маршрут выведен из ротации)
+        with self._lock:
+            self._by_source = {}
+            self._remaining = 0
+
+    def _take(self, i: int):
+        # Сдвигаем прогноз на изменение балансов, которое даёт i-й ордер плана
+        before, after = self._expected[i], self._expected[i + 1]
+        for chain in self._plan[i]:
+            self._projected[chain] += after[chain] - before[chain]
+        self._remaining -= 1
+        return self._plan[i]
+
+    def next_route(self):
+        with self._lock:
+            pending = [q for q in self._by_source.values() if q]
+            if not pending:
+                return None
+            return self._take(min(pending, key=lambda q: q[0]).popleft())
+
+    def next_target(self, source: str):
+        # Для воркеров по сетям: следующая цель из квоты конкретной source-сети. Пустая квота — не повод
+        # перестраивать план и не повод простаивать: сеть шлёт в лучшую цель по прогнозу балансов.
+        with self._lock:
+            steps = self._by_source.get(source)
+            if steps:
+                return self._take(steps.popleft())[1]
+            if source not in self._projected:
+                return None
+            step = _plan_step(self._projected, _planner_routes(self._projected), source)
+            if step is None:
+                return None
+            _apply_step(self._projected, source, *step)
+            return step[0]
+
+ROUTE_PLANNER = RoutePlanner(CONFIG["PLANNER_HORIZON_ORDERS"], CONFIG["PLANNER_REPLAN_DELTA_ETH"])
+
+def balances_eth_snapshot(chains) -> dict:
+    return {c: float(Web3.from_wei(BALANCE_TRACKER.get(c), 'ether')) for c in chains}
+
+def _planner_balances():
+    chains = get_enabled_chains()
+    return balances_eth_snapshot(chains), BALANCE_TRACKER.version
+
+def plan_next_route():
+    refresh_balances(get_enabled_chains())
+    balances, version = _planner_balances()
+    if ROUTE_PLANNER.needs_replan(balances, version):
+        ROUTE_PLANNER.replan(balances, version)
+    return ROUTE_PLANNER.next_route()
+
+def select_route():
+    # (source, target) для следующего ордера или None, если отправлять некуда
+    if CONFIG["ROUTE_PLANNER"]:
+        return plan_next_route()
+
+    all_sources = get_all_sources()
+    low_priority_targets = get_low_balance_chains()
+
+    source = choose_source_chain(all_sources)
+    # Продолжаем основной цикл после выбора source-chain:
+    targets = choose_targets_for_source(source, low_priority_targets)
+    if not targets:
+        return None
+    return source, random.choice(targets)
+
+def select_target(source: str):
+    # Цель для ордера из заданной сети (слот отправки сети в планировщике) или None
+    if CONFIG["ROUTE_PLANNER"]:
+        refresh_balances(get_enabled_chains())
+        balances, version = _planner_balances()
+        if ROUTE_PLANNER.needs_replan(balances, version):
+            ROUTE_PLANNER.replan(balances, version)
+        return ROUTE_PLANNER.next_target(source)
+
+    targets = choose_targets_for_source(source, get_low_balance_chains())
+    return random.choice(targets) if targets else None
+
+# ------------------- RECEIPT TRACKER ----------------------
+# Отправленные хэши ставятся в очередь по сетям, receipts опрашиваются batch-запросами в фоне.
+# Успешным ордер считается только после включения в блок со status == 1.
+
+class ReceiptTracker:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pending = {}  # chain -> {tx_hash: {"to_chain", "nonce", "sent_at", "sent_block", "tx", "filler"}}
+        self._replaced = {}  # chain -> {старый tx_hash: актуальный tx_hash} — заменённые TX тоже могут замайниться
+        self.stats = {}     # chain -> {"confirmed", "reverted", "dropped", "latency_sum", "latency_max", "gas_used"}
+        self.confirmed_orders = 0      # успешных ордеров (без заглушек nonce), включая восстановленные из журнала
+        self._balance_checked_at = 0   # confirmed_orders на момент последней проверки балансов
+
+    def _chain_stats(self, chain: str) -> dict:
+        return self.stats.setdefault(chain, {"confirmed": 0, "reverted": 0, "dropped": 0,
+                                             "latency_sum": 0.0, "latency_max": 0.0, "gas_used": 0})
+
+    def track(self, chain: str, tx_hash: str, to_chain: str, nonce: int, sent_at: float = None,
+              tx: dict = None, filler: bool = False):
+        with self._lock:
+            self._pending.setdefault(chain, {})[tx_hash] = {
+                "to_chain": to_chain, "nonce": nonce, "sent_at": sent_at or time.time(),
+                "sent_block": GAS_ORACLE.block_number(chain), "tx": tx, "filler": filler,
+            }
+
+    def pending_hashes(self, chain: str) -> list:
+        with self._lock:
+            return list(self._pending.get(chain, {})) + list(self._replaced.get(chain, {}))
+
+    def pending_nonces(self, chain: str) -> set:
+        with self._lock:
+            return {order["nonce"] for order in self._pending.get(chain, {}).values()}
+
+    def stuck(self, chain: str, block_number: int, after_blocks: int) -> list:
+        # TX, ждущие receipt не меньше after_blocks блоков. Без блока отправки — считаем от текущего
+        with self._lock:
+            stuck = []
+            for tx_hash, order in self._pending.get(chain, {}).items():
+                if order["sent_block"] is None:
+                    order["sent_block"] = block_number
+                elif block_number - order["sent_block"] >= after_blocks:
+                    stuck.append((tx_hash, dict(order)))
+            return stuck
+
+    def replace(self, chain: str, old_hash: str, new_hash: str, tx: dict, block_number: int):
+        with self._lock:
+            pending = self._pending.get(chain, {})
+            order = pending.pop(old_hash, None)
+            if order is None:
+                return False
+            pending[new_hash] = {**order, "tx": tx, "sent_block": block_number}
+            replaced = self._replaced.setdefault(chain, {})
+            for older, current in replaced.items():
+                if current == old_hash:
+                    replaced[older] = new_hash
+            replaced[old_hash] = new_hash
+            return True
+
+    def chains_with_pending(self) -> list:
+        with self._lock:
+            return [c for c, txs in self._pending.items() if txs]
+
+    def record_receipt(self, chain: str, tx_hash: str, receipt: dict):
+        with self._lock:
+            replaced = self._replaced.get(chain, {})
+            current = replaced.get(tx_hash, tx_hash)
+            order = self._pending.get(chain, {}).pop(current, None)
+            if order is None:
+                return None
+            # Замайнилась одна из версий TX — остальные версии этого nonce больше не ждём
+            for older in [h for h, c in replaced.items() if c == current]:
+                del replaced[older]
+            latency = time.time() - order["sent_at"]
+            stats = self._chain_stats(chain)
+            stats["confirmed" if receipt["status"] == 1 else "reverted"] += 1
+            stats["latency_sum"] += latency
+            stats["latency_max"] = max(stats["latency_max"], latency)
+            stats["gas_used"] += receipt["gasUsed"]
+            if receipt["status"] == 1 and not order["filler"]:
+                self.confirmed_orders += 1
+        # Включение nonce N в блок значит, что всё ниже тоже замайнено
+        NONCE_MANAGER.confirm_up_to(chain, order["nonce"] + 1)
+        return {**order, "latency": latency}
+
+    def restore_confirmed(self, count: int):
+        with self._lock:
+            self.confirmed_orders = self._balance_checked_at = count
+
+    def balance_check_due(self, every: int) -> bool:
+        # Проверка и отметка под одним lock: receipts приходят из нескольких потоков
+        with self._lock:
+            if self.confirmed_orders - self._balance_checked_at < every:
+                return False
+            self._balance_checked_at = self.confirmed_orders
+            return True
+
+    def drop_expired(self, chain: str, timeout_sec: float) -> list:
+        now = time.time()
+        with self._lock:
+            txs = self._pending.get(chain, {})
+            expired = {h: order["nonce"] for h, order in txs.items() if now - order["sent_at"] > timeout_sec}
+            for tx_hash in expired:
+                del txs[tx_hash]
+            replaced = self._replaced.get(chain, {})
+            for older in [h for h, c in replaced.items() if c in expired]:
+                del replaced[older]
+            self._chain_stats(chain)["dropped"] += len(expired)
+        return list(expired.items())
+
+RECEIPT_TRACKER = ReceiptTracker()
+
+def _parse_receipt(raw: dict) -> dict:
+    return {
+        "status": int(raw["status"], 16),
+        "gasUsed": int(raw["gasUsed"], 16),
+        "blockNumber": int(raw["blockNumber"], 16),
+    }
+
+def on_receipt(chain: str, tx_hash: str, raw_receipt: dict):
+    receipt = _parse_receipt(raw_receipt)
+    order = RECEIPT_TRACKER.record_receipt(chain, tx_hash, receipt)
+    if order is None:
+        return
+    if order["filler"]:
+        LOG.info("nonce_gap_closed", chain=chain, nonce=order["nonce"], tx_hash=tx_hash)
+        return
+    JOURNAL.order_status(tx_hash, "confirmed" if receipt["status"] == 1 else "reverted")
+    metric_labels = {"chain": chain, "route": f"{chain}→{order['to_chain']}"}
+    METRICS.observe("anyarb_inclusion_seconds", order["latency"], **metric_labels)
+    METRICS.inc("anyarb_receipts_total", status="success" if receipt["status"] == 1 else "reverted", **metric_labels)
+    if receipt["status"] == 1:
+        LOG.info("order_confirmed", from_chain=chain, to_chain=order["to_chain"], tx_hash=tx_hash,
+                 block=receipt["blockNumber"], latency_sec=order["latency"], gas_used=receipt["gasUsed"])
+    else:
+        LOG.warning("order_reverted", from_chain=chain, to_chain=order["to_chain"], tx_hash=tx_hash,
+                    block=receipt["blockNumber"])
+
+def _handle_receipt_responses(chain: str, hashes: list, responses: list):
+    for tx_hash, response in zip(hashes, responses):
+        if response.get("result"):
+            on_receipt(chain, tx_hash, response["result"])
+    for tx_hash, nonce in RECEIPT_TRACKER.drop_expired(chain, CONFIG["RECEIPT_TIMEOUT_SEC"]):
+        JOURNAL.order_status(tx_hash, "dropped")
+        NONCE_MANAGER.mark_dropped(chain, nonce)
+        LOG.warning("receipt_timeout", chain=chain, tx_hash=tx_hash, timeout_sec=CONFIG["RECEIPT_TIMEOUT_SEC"])
+
+def poll_receipts(chain: str):
+    hashes = RECEIPT_TRACKER.pending_hashes(chain)
+    if not hashes:
+        return
+    provider = WEB3_INSTANCES[chain].provider
+    requests_ = [("eth_getTransactionReceipt", [tx_hash]) for tx_hash in hashes]
+    responses = None
+    if len(requests_) > 1 and chain not in _batch_unsupported:
+        responses = provider.make_batch_request(requests_)
+        if not isinstance(responses, list):
+            if _batch_rejected(responses):
+                _mark_batch_unsupported(chain, responses.get("error"))
+            responses = None
+    if responses is None:
+        responses = [provider.make_request(method, params) for method, params in requests_]
+    _handle_receipt_responses(chain, hashes, responses)
+
+def poll_all_receipts():
+    for chain in HEADS.polled_chains(RECEIPT_TRACKER.chains_with_pending()):
+        try:
+            poll_receipts(chain)
+        except Exception as e:
+            LOG.warning("receipt_poll_error", chain=chain, error=e)
+
+def balance_check_due() -> bool:
+    # Проверка балансов раз на каждые BALANCE_CHECK_EVERY_SUCCESS_TX подтверждённых ордеров
+    return RECEIPT_TRACKER.balance_check_due(CONFIG["BALANCE_CHECK_EVERY_SUCCESS_TX"])
+
+def log_balances(chains):
+    LOG.info("balance_check")
+    for chain in chains:
+        LOG.info("balance_report", chain=chain, balance_wei=BALANCE_TRACKER.get(chain))
+    for chain, stats in sorted(RECEIPT_TRACKER.stats.items()):
+        included = stats["confirmed"] + stats["reverted"]
+        LOG.info("receipt_stats", chain=chain, confirmed=stats["confirmed"], reverted=stats["reverted"],
+                 dropped=stats["dropped"], avg_latency_sec=stats["latency_sum"] / included if included else 0,
+                 max_latency_sec=stats["latency_max"])
+
+# ------------------- STUCK TX WATCHDOG ----------------------
+# Раз в STUCK_CHECK_INTERVAL_SEC по каждой сети с неподтверждёнными TX: TX без receipt дольше
+# STUCK_AFTER_BLOCKS блоков переподписывается с тем же nonce и fee выше на REPLACEMENT_BUMP_PERCENT (и не
+# ниже текущего base fee), но не выше STUCK_MAX_FEE_GWEI. Nonce между замайненным и нашими pending, которых
+# нет ни в mempool-учёте, ни в подготовке два прохода подряд, закрываются пустой TX на себя.
+# Работает в своём потоке на синхронных провайдерах и в async-режиме тоже: это не горячий путь.
+
+FILLER_GAS_LIMIT = 21_000
+_gap_candidates = {}  # chain -> nonce'ы, которые в прошлый проход выглядели дырой
+
+def _ceil_percent(value: int, percent: float) -> int:
+    return -(-value * int(100 + percent) // 100)
+
+def bump_tx_fees(tx: dict, base_fee: int):
+    # None — замена не укладывается в STUCK_MAX_FEE_GWEI
+    priority_fee = _ceil_percent(tx['maxPriorityFeePerGas'], CONFIG["REPLACEMENT_BUMP_PERCENT"])
+    max_fee = max(_ceil_percent(tx['maxFeePerGas'], CONFIG["REPLACEMENT_BUMP_PERCENT"]), base_fee * 2 + priority_fee)
+    if max_fee > Web3.to_wei(CONFIG["STUCK_MAX_FEE_GWEI"], 'gwei'):
+        return None
+    return {**tx, 'maxFeePerGas': max_fee, 'maxPriorityFeePerGas': priority_fee}
+
+def replace_stuck_tx(w3: Web3, chain: str, tx_hash: str, order: dict, base_fee: int, block_number: int):
+    if order["tx"] is None:
+        return  # восстановлена из журнала без тела TX — переподписать нечего
+    tx = bump_tx_fees(order["tx"], base_fee)
+    if tx is None:
+        LOG.warning("stuck_fee_capped", chain=chain, tx_hash=tx_hash, nonce=order["nonce"],
+                    max_fee_gwei=CONFIG["STUCK_MAX_FEE_GWEI"])
+        return
+    new_hash = w3.to_hex(w3.eth.send_raw_transaction(sign_order_tx(tx).raw_transaction))
+    if not RECEIPT_TRACKER.replace(chain, tx_hash, new_hash, tx, block_number):
+        return  # receipt пришёл, пока подписывали
+    BALANCE_TRACKER.debit(chain, order_max_cost_wei(tx) - order_max_cost_wei(order["tx"]))
+    JOURNAL.order_status(tx_hash, "replaced")
+    JOURNAL.order_sent(chain, order["to_chain"], order["nonce"], new_hash, tx['value'])
+    METRICS.inc("anyarb_tx_replaced_total", chain=chain)
+    LOG.info("tx_replaced", chain=chain, nonce=order["nonce"], blocks=block_number - order["sent_block"],
+             max_fee_gwei=float(Web3.from_wei(tx["maxFeePerGas"], "gwei")), tx_hash=new_hash)
+
+def fill_nonce_gap(w3: Web3, chain: str, nonce: int, base_fee: int):
+    if not NONCE_MANAGER.claim(chain, nonce):
+        return
+    priority_fee = Web3.to_wei(1, 'gwei')
+    tx = {
+        'to': SENDER_ADDRESS,
+        'value': 0,
+        'gas': FILLER_GAS_LIMIT,
+        'maxFeePerGas': base_fee * 2 + priority_fee,
+        'maxPriorityFeePerGas': priority_fee,
+        'type': 2,
+        'chainId': w3.eth.chain_id,
+        'nonce': nonce,
+    }
+    tx_hash = w3.to_hex(w3.eth.send_raw_transaction(sign_order_tx(tx).raw_transaction))
+    RECEIPT_TRACKER.track(chain, tx_hash, chain, nonce, tx=tx, filler=True)
+    METRICS.inc("anyarb_nonce_gaps_filled_total", chain=chain)
+    LOG.info("nonce_gap_filled", chain=chain, nonce=nonce, tx_hash=tx_hash)
+
+def find_nonce_gaps(w3: Web3, chain: str) -> list:
+    pending = RECEIPT_TRACKER.pending_nonces(chain)
+    if not pending:
+        return []
+    latest = w3.eth.get_transaction_count(SENDER_ADDRESS, 'latest')
+    NONCE_MANAGER.confirm_up_to(chain, latest)
+    preparing = PRESIGNED_ORDERS.nonces(chain)
+    missing = {n for n in range(latest, max(pending)) if n not in pending and n not in preparing}
+    # nonce мог быть только что выдан воркеру, который ещё симулирует/подписывает — ждём второй проход
+    gaps = sorted(missing & _gap_candidates.get(chain, set()))
+    _gap_candidates[chain] = missing - set(gaps)
+    return gaps
+
+def check_stuck_chain(chain: str):
+    w3 = WEB3_INSTANCES[chain]
+    history = w3.eth.fee_history(1, 'latest')
+    block_number, base_fee = history['oldestBlock'], history['baseFeePerGas'][-1]
+    GAS_ORACLE.update_fee(chain, block_number, base_fee)
+    gaps = find_nonce_gaps(w3, chain)
+    for nonce in gaps:
+        fill_nonce_gap(w3, chain, nonce, base_fee)
+    for tx_hash, order in RECEIPT_TRACKER.stuck(chain, block_number, CONFIG["STUCK_AFTER_BLOCKS"]):
+        if gaps and order["nonce"] > gaps[0]:
+            continue  # стояла за дырой, а не из-за fee
+        replace_stuck_tx(w3, chain, tx_hash, order, base_fee, block_number)
+
+def check_stuck_chains():
+    for chain in RECEIPT_TRACKER.chains_with_pending():
+        try:
+            check_stuck_chain(chain)
+        except Exception as e:
+            LOG.warning("stuck_check_error", chain=chain, error=e)
+
+def stuck_tx_watchdog_loop():
+    while True:
+        time.sleep(CONFIG["STUCK_CHECK_INTERVAL_SEC"])
+        check_stuck_chains()
+
+def start_stuck_tx_watchdog():
+    if CONFIG["STUCK_CHECK_INTERVAL_SEC"] > 0:
+        threading.Thread(target=stuck_tx_watchdog_loop, name="stuck-tx-watchdog", daemon=True).start()
+
+# ------------------- ORDER JOURNAL ----------------------
+# Журнал в SQLite (WAL): отправленные ордера и смены их статуса дописываются событиями, последние estimate
+# хранятся по маршруту. Запись — очередь и один фоновый поток, который коммитит пачками, так что путь ордера
+# не ждёт диска. При старте журнал прогревает кэш estimate, счётчик подтверждённых TX и возвращает
+# неподтверждённые хэши в RECEIPT_TRACKER. Nonce'ы по-прежнему сверяются с RPC при первом preflight.
+
+JOURNAL_SCHEMA = """
+CREATE TABLE IF NOT EXISTS order_events (
+    id INTEGER PRIMARY KEY,
+    ts REAL NOT NULL,
+    tx_hash TEXT NOT NULL,
+    status TEXT NOT NULL,
+    chain TEXT,
+    to_chain TEXT,
+    nonce INTEGER,
+    amount_wei TEXT
+);
+CREATE INDEX IF NOT EXISTS order_events_tx_hash ON order_events (tx_hash);
+CREATE TABLE IF NOT EXISTS estimates (
+    route TEXT PRIMARY KEY,
+    amount_wei TEXT NOT NULL,
+    fetched_at REAL NOT NULL
+);
+"""
+JOURNAL_FINAL_STATUSES = ("confirmed", "reverted", "dropped", "replaced")
+
+class OrderJournal:
+    def __init__(self):
+        self.path = None
+        self._queue = Queue()
+        self._writer = None
+
+    def open(self, path: str):
+        self.path = path
+        with self._connect() as db:
+            db.executescript(JOURNAL_SCHEMA)
+        self._writer = threading.Thread(target=self._write_loop, name="journal-writer", daemon=True)
+        self._writer.start()
+        atexit.register(self.close)
+
+    def _connect(self):
+        db = sqlite3.connect(self.path)
+        db.execute("PRAGMA journal_mode=WAL")
+        db.execute("PRAGMA synchronous=NORMAL")
+        return db
+
+    # -- запись: только очередь, SQLite трогает поток journal-writer -- #
+
+    def order_sent(self, chain: str, to_chain: str, nonce: int, tx_hash: str, amount_wei: int):
+        if self.path:
+            self._queue.put(("event", (time.time(), tx_hash, "sent", chain, to_chain, nonce, str(amount_wei))))
+
+    def order_status(self, tx_hash: str, status: str):
+        if self.path:
+            self._queue.put(("event", (time.time(), tx_hash, status, None, None, None, None)))
+
+    def estimate(self, route: str, amount_wei: int, fetched_at: float):
+        if self.path:
+            self._queue.put(("estimate", (route, str(amount_wei), fetched_at)))
+
+    def _write_loop(self):
+        db = self._connect()
+        while True:
+            batch = [self._queue.get()]
+            try:
+                while len(batch) < 500:
+                    batch.append(self._queue.get_nowait())
+            except Empty:
+                pass
+            stop = any(kind == "stop" for kind, _ in batch)
+            try:
+                with db:
+                    db.executemany("INSERT INTO order_events (ts, tx_hash, status, chain, to_chain, nonce, amount_wei)"
+                                   " VALUES (?, ?, ?, ?, ?, ?, ?)", [row for kind, row in batch if kind == "event"])
+                    db.executemany("INSERT OR REPLACE INTO estimates (route, amount_wei, fetched_at) VALUES (?, ?, ?)",
+                                   [row for kind, row in batch if kind == "estimate"])
+            except sqlite3.Error as e:
+                LOG.error("journal_write_error", error=e)
+            if stop:
+                db.close()
+                return
+
+    def close(self):
+        if self._writer is not None and self._writer.is_alive():
+            self._queue.put(("stop", None))
+            self._writer.join(timeout=5)
+
+    # -- чтение при старте -- #
+
+    def load(self) -> dict:
+        with self._connect() as db:
+            cutoff = time.time() - CONFIG["JOURNAL_RETENTION_DAYS"] * 86400
+            placeholders = ",".join("?" * len(JOURNAL_FINAL_STATUSES))
+            db.execute(f"DELETE FROM order_events WHERE tx_hash IN (SELECT tx_hash FROM order_events"
+                       f" WHERE status IN ({placeholders}) AND ts < ?)", (*JOURNAL_FINAL_STATUSES, cutoff))
+            pending = db.execute(
+                f"SELECT chain, to_chain, nonce, tx_hash, ts FROM order_events s WHERE status = 'sent'"
+                f" AND NOT EXISTS (SELECT 1 FROM order_events f WHERE f.tx_hash = s.tx_hash"
+                f" AND f.status IN ({placeholders}))", JOURNAL_FINAL_STATUSES).fetchall()
+            confirmed = db.execute("SELECT COUNT(*) FROM order_events WHERE status = 'confirmed'").fetchone()[0]
+            # Котировка старше самого длинного интервала обновления уже устарела бы и без перезапуска —
+            # после простоя по ней не торгуем, первый ордер маршрута ждёт свежую из API
+            db.execute("DELETE FROM estimates WHERE fetched_at < ?",
+                       (time.time() - max(CONFIG["ESTIMATE_REFRESH_INTERVAL_RANGE_SEC"]),))
+            estimates = db.execute("SELECT route, amount_wei, fetched_at FROM estimates").fetchall()
+        return {"pending": pending, "confirmed": confirmed, "estimates": estimates}
+
+JOURNAL = OrderJournal()
+
+def restore_from_journal():
+    if not CONFIG["JOURNAL_FILE"]:
+        return
+    JOURNAL.open(CONFIG["JOURNAL_FILE"])
+    state = JOURNAL.load()
+    for chain, to_chain, nonce, tx_hash, sent_at in state["pending"]:
+        if chain in RPCS:
+            RECEIPT_TRACKER.track(chain, tx_hash, to_chain, nonce, sent_at=sent_at)
+    for route, amount_wei, fetched_at in state["estimates"]:
+        _estimate_cache[route] = int(amount_wei)
+        _estimate_timestamps[route] = fetched_at
+        # Журнал хранит только котировку ORDER_AMOUNT_WEI, кривой по сетке нет — маршрут сразу уходит
+        # на фоновое обновление, а до него ордер идёт по сохранённой котировке
+        _estimate_refresh_intervals[route] = 0
+    RECEIPT_TRACKER.restore_confirmed(state["confirmed"])
+    LOG.info("journal_restored", path=CONFIG["JOURNAL_FILE"], pending=len(state["pending"]),
+             estimates=len(state["estimates"]), confirmed=state["confirmed"])
 
 # ------------------- PAUSE LOGIC ----------------------
 
@@ -264,7 +2609,7 @@ def read_pauses_schedule():
             # data format: { "date": "YYYY-MM-DD", "pauses": [{"start": timestamp, "duration": seconds}, ...], "last_big_pause": timestamp }
             return data
     except Exception as e:
-        print(f"⚠️ Ошибка чтения расписания пауз: {e}")
+        LOG.warning("pause_schedule_read_error", error=e)
         return None
 
 def save_pauses_schedule(schedule):
@@ -272,7 +2617,7 @@ def save_pauses_schedule(schedule):
         with open(CONFIG["PAUSE_FILE"], "w", encoding="utf-8") as f:
             json.dump(schedule, f)
     except Exception as e:
-        print(f"⚠️ Ошибка записи расписания пауз: {e}")
+        LOG.warning("pause_schedule_write_error", error=e)
 
 def generate_pauses_schedule(last_big_pause_ts=None):
     today_date = datetime.utcnow().date()
@@ -344,7 +2689,7 @@ def generate_pauses_schedule(last_big_pause_ts=None):
         "last_big_pause": int(big_pause_start.timestamp())
     }
     save_pauses_schedule(schedule)
-    print(f"🕒 Сгенерировано расписание пауз на {today_date}: {len(pauses)} пауз (большая - {big_pause_duration})")
+    LOG.info("pause_schedule", date=today_date.isoformat(), pauses=len(pauses), big_pause=str(big_pause_duration))
     return schedule
 
 def get_current_pause(schedule):
@@ -364,76 +2709,803 @@ def should_generate_new_schedule(schedule):
         return True
     return False
 
-def wait_for_pause_end(pause):
-    pause_end_ts = pause["start"] + pause["duration"]
-    now_ts = int(time.time())
-    sleep_seconds = pause_end_ts - now_ts
-    if sleep_seconds > 0:
-        pause_type = pause.get("type", "pause")
-        print(f"⏸ {pause_type.capitalize()} пауза активна, спим {sleep_seconds} сек...")
-        time.sleep(sleep_seconds)
+def pause_window_task(state: dict) -> float:
+    # Граница окна паузы: в начале паузы отправка встаёт до её конца, в конце — ждём начала следующей.
+    # Паузы отсортированы, state["pause_index"] не даёт пересматривать прошедшие
+    now = time.time()
+    active = state["active_pause"]
+    if active is not None and now >= active["start"] + active["duration"]:
+        state["active_pause"] = None
+        if active["type"] == "big":
+            LOG.info("pause_big_finished")
+            state["schedule"] = generate_pauses_schedule(last_big_pause_ts=active["start"])
+            state["pause_index"] = 0
+    pauses = state["schedule"]["pauses"]
+    i = state["pause_index"]
+    while i < len(pauses) and pauses[i]["start"] + pauses[i]["duration"] <= now:
+        i += 1
+    state["pause_index"] = i
+    if i == len(pauses):
+        return 3600
+    pause = pauses[i]
+    if pause["start"] > now:
+        return pause["start"] - now
+    state["active_pause"] = pause
+    sleep_seconds = pause["start"] + pause["duration"] - now
+    LOG.info("pause", pause_type=pause.get("type", "pause").capitalize(), sleep_sec=int(sleep_seconds))
+    return sleep_seconds
+
+# ------------------- ASYNC ENGINE ----------------------
+# Включается CONFIG["ASYNC_MODE"]: отдельный воркер на каждую source-сеть из ALLOWED_ROUTES,
+# все RPC через AsyncWeb3, запросы estimate к t2rn — в том же event loop.
+
+ASYNC_WEB3_INSTANCES = {}
+_estimate_inflight = {}
+_quote_curve_tasks = set()  # фоновая досъёмка сетки; ссылки держим, чтобы задачи не собрал GC
+
+async def request_quote_async(session, from_chain: str, to_chain: str, amount_wei: int) -> int:
+    timeout = aiohttp.ClientTimeout(total=5)
+    await ESTIMATE_LIMITER.acquire_async()
+    payload = _estimate_payload(from_chain, to_chain, amount_wei)
+    async with session.post(ESTIMATE_URL, headers=ESTIMATE_HEADERS, json=payload, timeout=timeout) as response:
+        if response.status == 429:
+            ESTIMATE_LIMITER.throttled(_retry_after(response.headers))
+        response.raise_for_status()
+        return _parse_estimate(await response.json())
+
+async def _request_estimate_async(session, key: str, from_chain: str, to_chain: str) -> int:
+    now = time.time()
+    LOG.info("estimate_refresh", route=key)
+    started = time.perf_counter()
+    try:
+        value = _store_estimate(key, await request_quote_async(session, from_chain, to_chain, ORDER_AMOUNT_WEI), now)
+    except Exception:
+        METRICS.inc("anyarb_estimate_errors_total", route=key)
+        raise
+    finally:
+        METRICS.observe("anyarb_estimate_fetch_seconds", time.perf_counter() - started, route=key)
+    if quote_grid_wei():
+        task = asyncio.ensure_future(_refresh_quote_curve_async(session, key, from_chain, to_chain, value))
+        _quote_curve_tasks.add(task)
+        task.add_done_callback(_quote_curve_tasks.discard)
+    return value
 
-# ------------------- MAIN LOOP ----------------------
+async def _refresh_quote_curve_async(session, key: str, from_chain: str, to_chain: str, order_value: int):
+    try:
+        grid = quote_grid_wei()
+        received = await asyncio.gather(*(request_quote_async(session, from_chain, to_chain, amount) for amount in grid))
+        _store_quote_curve(key, order_value, dict(zip(grid, received)))
+    except Exception as e:
+        METRICS.inc("anyarb_estimate_errors_total", route=key)
+        LOG.warning("estimate_error", route=key, error=e)
 
-success_tx_count = 0
-check_balances()
-
-# Загружаем расписание пауз
-schedule = read_pauses_schedule()
-if should_generate_new_schedule(schedule):
-    last_big_pause = schedule["last_big_pause"] if schedule else None
-    schedule = generate_pauses_schedule(last_big_pause_ts=last_big_pause)
-
-while True:
-    # Проверяем паузу
-    current_pause = get_current_pause(schedule)
-    if current_pause:
-        # В паузе — спим
-        wait_for_pause_end(current_pause)
-        # Если это большая пауза — обновляем расписание на следующий день после её окончания
-        if current_pause["type"] == "big":
-            print("🔄 Большая пауза закончилась, обновляем расписание пауз...")
-            schedule = generate_pauses_schedule(last_big_pause_ts=current_pause["start"])
-        continue  # После паузы идём к следующему циклу
-
-    if success_tx_count > 0 and success_tx_count % CONFIG["BALANCE_CHECK_EVERY_SUCCESS_TX"] == 0:
-        check_balances()
+def _on_estimate_task_done(key: str, task):
+    _estimate_inflight.pop(key, None)
+    if not task.cancelled() and task.exception() is not None:
+        LOG.warning("estimate_error", route=key, error=task.exception())
 
-    all_sources = [c for c in CONFIG["ALLOWED_ROUTES"].keys() if c in CONFIG["ENABLED_CHAINS"]]
-    low_priority_targets = get_low_balance_chains()
+def _ensure_estimate_task(session, from_chain: str, to_chain: str):
+    # Несколько воркеров могут одновременно упереться в один и тот же маршрут — ходим в API один раз
+    key = f"{from_chain}→{to_chain}"
+    task = _estimate_inflight.get(key)
+    if task is None:
+        task = asyncio.ensure_future(_request_estimate_async(session, key, from_chain, to_chain))
+        _estimate_inflight[key] = task
+        task.add_done_callback(lambda t: _on_estimate_task_done(key, t))
+    return task
+
+async def fetch_estimated_amount_wei_async(session, from_chain: str, to_chain: str,
+                                           amount_wei: int = ORDER_AMOUNT_WEI) -> int:
+    key = f"{from_chain}→{to_chain}"
 
-    target_candidates = low_priority_targets if low_priority_targets else list(set(
-        t for src in all_sources for t in CONFIG["ALLOWED_ROUTES"][src]
-    ) & set(CONFIG["ENABLED_CHAINS"]))
+    if key not in _estimate_cache:
+        METRICS.inc("anyarb_estimate_cache_misses_total", route=key)
+        try:
+            value = await asyncio.shield(_ensure_estimate_task(session, from_chain, to_chain))
+        except Exception as e:
+            if key not in _estimate_cache:
+                raise e
+            value = _estimate_cache[key]
+        if amount_wei == ORDER_AMOUNT_WEI:
+            return value
+    else:
+        METRICS.inc("anyarb_estimate_cache_hits_total", route=key)
+        if _estimate_needs_refresh(key, time.time()):
+            _ensure_estimate_task(session, from_chain, to_chain)
+        if amount_wei == ORDER_AMOUNT_WEI:
+            return _cached_estimate(key)
+    value = _local_quote(key, amount_wei)
+    if value is None:
+        LOG.info("quote_off_curve", route=key, amount_wei=amount_wei)
+        value = await request_quote_async(session, from_chain, to_chain, amount_wei)
+    return value
 
-    source = choose_source_chain(all_sources)
-    # Продолжаем основной цикл после выбора source-chain:
+async def async_estimate_refresher(session):
+    while True:
+        routes = get_all_routes()
+        now = time.time()
+        for from_chain, to_chain in routes:
+            if _route_due_for_refresh(f"{from_chain}→{to_chain}", now):
+                _ensure_estimate_task(session, from_chain, to_chain)
+        await asyncio.sleep(_seconds_until_next_estimate_refresh(routes))
+
+async def allocate_nonce_async(w3: AsyncWeb3, chain: str):
+    if not NONCE_MANAGER.is_seeded(chain):
+        pending, latest = await asyncio.gather(
+            w3.eth.get_transaction_count(SENDER_ADDRESS, 'pending'),
+            w3.eth.get_transaction_count(SENDER_ADDRESS, 'latest'),
+        )
+        NONCE_MANAGER.seed(chain, pending, latest)
+    nonce = NONCE_MANAGER.allocate(chain)
+    if nonce is None:
+        NONCE_MANAGER.confirm_up_to(chain, await w3.eth.get_transaction_count(SENDER_ADDRESS, 'latest'))
+        nonce = NONCE_MANAGER.allocate(chain)
+    return nonce
+
+async def fetch_preflight_async(w3: AsyncWeb3, chain: str) -> dict:
+    calls = _preflight_calls(w3, chain)
+    names = [name for name, _ in calls]
+    batch_error = None
+    if len(calls) > 1 and chain not in _batch_unsupported:
+        try:
+            async with w3.batch_requests() as batch:
+                for _, call in calls:
+                    batch.add(call())
+                results = await batch.async_execute()
+            return _apply_preflight(chain, names, results)
+        except Exception as e:
+            batch_error = e
+    results = await asyncio.gather(*(call() for _, call in calls))
+    if batch_error is not None and _batch_rejected(batch_error):
+        _mark_batch_unsupported(chain, batch_error)
+    return _apply_preflight(chain, names, results)
+
+async def prepare_order_async(w3: AsyncWeb3, session, from_chain: str, to_chain: str):
+    nonce = None
+    timer = OrderTimer(from_chain, to_chain)
+    try:
+        preflight = await fetch_preflight_async(w3, from_chain)
+        timer.lap("preflight")
+        LOG.debug("balance", chain=from_chain, balance_wei=preflight["balance"])
+        if preflight["balance"] < Web3.to_wei(CONFIG["MIN_BALANCE_TO_SEND"], 'ether'):
+            LOG.info("skip_low_balance", chain=from_chain, min_eth=CONFIG["MIN_BALANCE_TO_SEND"])
+            timer.finish("skipped")
+            return None
+
+        amount_wei = order_amount_wei(preflight["balance"])
+        if amount_wei == 0:
+            LOG.info("skip_small_order", chain=from_chain, min_eth=CONFIG["ORDER_MIN_ETH"])
+            timer.finish("skipped")
+            return None
+
+        estimated_amount = await fetch_estimated_amount_wei_async(session, from_chain, to_chain, amount_wei)
+        timer.lap("estimate")
+        tx_common = build_order_tx_common(from_chain, to_chain, estimated_amount, amount_wei)
+
+        nonce = await allocate_nonce_async(w3, from_chain)
+        timer.lap("nonce")
+        if nonce is None:
+            LOG.info("skip_inflight", chain=from_chain, inflight=NONCE_MANAGER.max_inflight)
+            timer.finish("skipped")
+            return None
+
+        tx = finalize_order_tx(tx_common, FALLBACK_GAS_LIMIT, preflight["base_fee"], preflight["chain_id"], nonce)
+        gas_limit, revert = await simulate_order_async(w3, from_chain, to_chain, tx)
+        timer.lap("simulate")
+        if revert is not None:
+            LOG.warning("sim_reverted", from_chain=from_chain, to_chain=to_chain, nonce=nonce,
+                        reason=revert["reason"], kind=revert["kind"])
+            NONCE_MANAGER.release(from_chain, nonce)
+            timer.finish("sim_reverted")
+            return None
+        tx['gas'] = gas_limit
+
+        signed_tx = await sign_order_tx_async(tx)
+        timer.lap("sign")
+        return make_prepared_order(from_chain, to_chain, tx, signed_tx, timer)
 
-    allowed_targets_for_source = [t for t in CONFIG["ALLOWED_ROUTES"].get(source, []) if t in CONFIG["ENABLED_CHAINS"]]
+    except Exception as e:
+        handle_send_failure(from_chain, nonce, e)
+        timer.finish("failed")
+        return None
 
-    # Фильтруем allowed_targets_for_source так, чтобы они совпадали с target_candidates,
-    # либо если target_candidates пусты — берём все разрешённые
-    targets = [t for t in allowed_targets_for_source if t in target_candidates]
-    if not targets:
-        targets = allowed_targets_for_source
+async def broadcast_order_async(w3: AsyncWeb3, order: dict) -> bool:
+    from_chain, to_chain, timer = order["from_chain"], order["to_chain"], order["timer"]
+    try:
+        timer.resume()
+        tx_hash = await w3.eth.send_raw_transaction(order["raw_tx"])
+        timer.lap("broadcast")
+        BALANCE_TRACKER.debit(from_chain, order_max_cost_wei(order["tx"]))
+        RECEIPT_TRACKER.track(from_chain, w3.to_hex(tx_hash), to_chain, order["nonce"], tx=order["tx"])
+        JOURNAL.order_sent(from_chain, to_chain, order["nonce"], w3.to_hex(tx_hash), order["tx"]['value'])
+
+        LOG.info("order_sent", from_chain=from_chain, to_chain=to_chain, nonce=order["nonce"],
+                 tx_hash=w3.to_hex(tx_hash), value_wei=order["tx"]['value'])
+        AIMD.on_success()
+        timer.finish("sent")
+        return True
 
-    if not targets:
-        print("⚠️ Нет доступных target-цепочек для выбранного source. Ждём...")
-        time.sleep(60)
-        continue
+    except Exception as e:
+        handle_send_failure(from_chain, order["nonce"], e, broadcast=True)
+        timer.finish("failed")
+        return False
+
+async def send_remote_order_tx_async(w3: AsyncWeb3, session, from_chain: str, to_chain: str) -> bool:
+    order = await prepare_order_async(w3, session, from_chain, to_chain)
+    return order is not None and await broadcast_order_async(w3, order)
+
+_balance_inflight = {}
+
+async def _refresh_balance_async(chain: str):
+    BALANCE_TRACKER.update(chain, await ASYNC_WEB3_INSTANCES[chain].eth.get_balance(SENDER_ADDRESS))
+
+async def refresh_balances_async(chains, force: bool = False):
+    tasks = []
+    for chain in (chains if force else BALANCE_TRACKER.stale_chains(chains)):
+        task = _balance_inflight.get(chain)
+        if task is None:
+            task = asyncio.ensure_future(_refresh_balance_async(chain))
+            _balance_inflight[chain] = task
+            task.add_done_callback(lambda _, c=chain: _balance_inflight.pop(c, None))
+        tasks.append(task)
+    await asyncio.gather(*tasks)
+
+async def get_low_balance_chains_async():
+    chains = get_enabled_chains()
+    await refresh_balances_async(chains)
+    return [c for c in chains if Web3.from_wei(BALANCE_TRACKER.get(c), 'ether') < CONFIG["THRESHOLD_ETH"]]
+
+async def check_balances_async():
+    chains = get_enabled_chains()
+    await refresh_balances_async(chains)
+    log_balances(chains)
+
+async def async_balance_refresher():
+    while True:
+        await asyncio.sleep(CONFIG["BALANCE_REFRESH_INTERVAL_SEC"])
+        try:
+            await refresh_balances_async(HEADS.polled_chains(get_enabled_chains()), force=True)
+        except Exception as e:
+            LOG.warning("balance_refresh_error", error=e)
+
+async def poll_receipts_async(chain: str):
+    hashes = RECEIPT_TRACKER.pending_hashes(chain)
+    if not hashes:
+        return
+    provider = ASYNC_WEB3_INSTANCES[chain].provider
+    requests_ = [("eth_getTransactionReceipt", [tx_hash]) for tx_hash in hashes]
+    responses = None
+    if len(requests_) > 1 and chain not in _batch_unsupported:
+        responses = await provider.make_batch_request(requests_)
+        if not isinstance(responses, list):
+            if _batch_rejected(responses):
+                _mark_batch_unsupported(chain, responses.get("error"))
+            responses = None
+    if responses is None:
+        responses = await asyncio.gather(*(provider.make_request(method, params) for method, params in requests_))
+    _handle_receipt_responses(chain, hashes, responses)
+
+async def async_receipt_poller():
+    while True:
+        await asyncio.sleep(CONFIG["RECEIPT_POLL_INTERVAL_SEC"])
+        chains = HEADS.polled_chains(RECEIPT_TRACKER.chains_with_pending())
+        results = await asyncio.gather(*(poll_receipts_async(c) for c in chains), return_exceptions=True)
+        for chain, result in zip(chains, results):
+            if isinstance(result, Exception):
+                LOG.warning("receipt_poll_error", chain=chain, error=result)
+
+async def async_pause_supervisor(state: dict, running: asyncio.Event):
+    # Единственный владелец расписания пауз: во время паузы гасит running, воркеры ждут
+    while True:
+        current_pause = get_current_pause(state["schedule"])
+        if current_pause:
+            running.clear()
+            pause_end_ts = current_pause["start"] + current_pause["duration"]
+            sleep_seconds = pause_end_ts - int(time.time())
+            if sleep_seconds > 0:
+                pause_type = current_pause.get("type", "pause")
+                LOG.info("pause", pause_type=pause_type.capitalize(), sleep_sec=sleep_seconds)
+                await asyncio.sleep(sleep_seconds)
+            if current_pause["type"] == "big":
+                LOG.info("pause_big_finished")
+                state["schedule"] = generate_pauses_schedule(last_big_pause_ts=current_pause["start"])
+            continue
+        running.set()
+        now_ts = int(time.time())
+        upcoming = [p["start"] - now_ts for p in state["schedule"]["pauses"] if p["start"] > now_ts]
+        await asyncio.sleep(min(upcoming + [60]))
+
+async def select_target_async(source: str):
+    if CONFIG["ROUTE_PLANNER"]:
+        await refresh_balances_async(get_enabled_chains())
+        balances, version = _planner_balances()
+        if ROUTE_PLANNER.needs_replan(balances, version):
+            ROUTE_PLANNER.replan(balances, version)
+        # Квота этой сети в текущем плане исчерпана — ей пока нечего отправлять
+        return ROUTE_PLANNER.next_target(source)
+
+    low_priority_targets = await get_low_balance_chains_async()
+    targets = choose_targets_for_source(source, low_priority_targets)
+    return random.choice(targets) if targets else None
+
+_presign_tasks = {}
+
+async def presign_orders_async(w3: AsyncWeb3, session, source: str):
+    try:
+        while PRESIGNED_ORDERS.count(source) < CONFIG["PRESIGN_ORDERS_PER_CHAIN"]:
+            target = await select_target_async(source)
+            if target is None:
+                return
+            order = await prepare_order_async(w3, session, source, target)
+            if order is None:
+                return
+            PRESIGNED_ORDERS.put(order)
+    except Exception as e:
+        LOG.warning("presign_error", chain=source, error=e)
+
+async def async_chain_worker(source: str, session, running: asyncio.Event, warm_up_task=None):
+    w3 = ASYNC_WEB3_INSTANCES[source]
+    if warm_up_task is not None:
+        await warm_up_task
+    retry_in = 1
+    while True:
+        await running.wait()
+        try:
+            delay_sec = await _async_worker_iteration(w3, source, session)
+            retry_in = 1
+        except Exception as e:
+            # Ошибка одной сети (RPC баланса, выбор цели) не должна останавливать остальные воркеры
+            LOG.error("worker_error", chain=source, error=e, retry_in=retry_in)
+            delay_sec = retry_in
+            retry_in = min(retry_in * 2, 60)
+        await asyncio.sleep(delay_sec)
+
+async def _async_worker_iteration(w3: AsyncWeb3, source: str, session) -> float:
+    # Один ордер сети; возвращает паузу до следующего
+    order = PRESIGNED_ORDERS.take(source)
+    if order is not None:
+        LOG.info("order_presigned", from_chain=source, to_chain=order["to_chain"])
+        success = await broadcast_order_async(w3, order)
+    else:
+        target = await select_target_async(source)
+        if target is None:
+            LOG.warning("no_targets", chain=source)
+            return 60
+
+        LOG.info("order_start", from_chain=source, to_chain=target)
+
+        success = await send_remote_order_tx_async(w3, session, source, target)
+    if balance_check_due():
+        await check_balances_async()
+    if CONFIG["PRESIGN_ORDERS_PER_CHAIN"] > 0 and source not in _presign_tasks:
+        # Готовим следующие ордера этой сети, пока воркер ждёт задержку
+        _presign_tasks[source] = asyncio.ensure_future(presign_orders_async(w3, session, source))
+        _presign_tasks[source].add_done_callback(lambda _: _presign_tasks.pop(source, None))
+
+    delay_sec = next_delay_sec(success)
+    LOG.info("delay", chain=source, delay_sec=delay_sec)
+    return delay_sec
+
+async def supervised(name: str, make_coro):
+    # Перезапускает упавшую фоновую корутину с backoff: одна задача не роняет весь движок
+    retry_in = 1
+    while True:
+        try:
+            await make_coro()
+            return
+        except Exception as e:
+            LOG.error("task_restart", task=name, error=e, retry_in=retry_in)
+            await asyncio.sleep(retry_in)
+            retry_in = min(retry_in * 2, 60)
+
+async def run_async_engine(schedule):
+    for name in RPCS:
+        ASYNC_WEB3_INSTANCES[name] = AsyncWeb3(make_async_http_provider(name))
+    state = {"schedule": schedule}
+    running = asyncio.Event()
+    start_stuck_tx_watchdog()
+    async with aiohttp.ClientSession() as session:
+        warm_ups = warm_up_async(session)
+        tasks = {"pause-supervisor": lambda: async_pause_supervisor(state, running),
+                 "receipt-poller": async_receipt_poller}
+        for source in get_configured_sources():
+            tasks[f"worker:{source}"] = (lambda source=source:
+                                         async_chain_worker(source, session, running, warm_ups.get(source)))
+        if CONFIG["BALANCE_REFRESH_INTERVAL_SEC"] > 0:
+            tasks["balance-refresher"] = async_balance_refresher
+        if CONFIG["ESTIMATE_BACKGROUND_REFRESH"]:
+            tasks["estimate-refresher"] = lambda: async_estimate_refresher(session)
+        for chain in head_chains():
+            tasks[f"heads:{chain}"] = lambda chain=chain: watch_new_heads(chain, on_new_head_async)
+        await asyncio.gather(*(supervised(name, make_coro) for name, make_coro in tasks.items()))
+
+# ------------------- NEW HEADS (WEBSOCKET) ----------------------
+# Для сетей с ws-URL в RPCS: подписка на newHeads. Каждый блок обновляет base fee в GAS_ORACLE, а не чаще
+# WS_STATE_REFRESH_MIN_SEC — баланс и pending receipts (receipts же подтверждают nonce'ы). Пока блоки
+# приходят, ордера не зовут fee_history/get_balance, а интервальные опросы эту сеть пропускают.
+# Сети без ws-URL (или с оборвавшейся подпиской) остаются на опросе по HTTP.
+
+class HeadTracker:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._heads = {}  # chain -> (block_number, received_at)
+        self._refreshed = {}  # chain -> время последнего обновления состояния по блоку
+        self._refreshing = set()
+
+    def record(self, chain: str, block_number: int):
+        with self._lock:
+            self._heads[chain] = (block_number, time.time())
+
+    def is_live(self, chain: str) -> bool:
+        with self._lock:
+            head = self._heads.get(chain)
+        return head is not None and time.time() - head[1] < CONFIG["WS_HEAD_STALE_SEC"]
+
+    def forget(self, chain: str):
+        with self._lock:
+            self._heads.pop(chain, None)
+
+    def polled_chains(self, chains) -> list:
+        return [c for c in chains if not self.is_live(c)]
+
+    def begin_refresh(self, chain: str) -> bool:
+        with self._lock:
+            if chain in self._refreshing or time.time() - self._refreshed.get(chain, 0) < CONFIG["WS_STATE_REFRESH_MIN_SEC"]:
+                return False
+            self._refreshing.add(chain)
+            self._refreshed[chain] = time.time()
+            return True
+
+    def end_refresh(self, chain: str):
+        with self._lock:
+            self._refreshing.discard(chain)
+
+HEADS = HeadTracker()
+
+def head_chains() -> list:
+    return [c for c in RPCS if ws_url(c)]
+
+def record_new_head(chain: str, head) -> bool:
+    # True — пора обновить баланс/receipts сети
+    block_number = head["number"]
+    HEADS.record(chain, block_number)
+    if head.get("baseFeePerGas") is not None:
+        GAS_ORACLE.update_fee(chain, block_number, head["baseFeePerGas"], pushed=True)
+    METRICS.inc("anyarb_new_heads_total", chain=chain)
+    return HEADS.begin_refresh(chain)
+
+def refresh_chain_state(chain: str):
+    try:
+        refresh_balances([chain], force=True)
+        poll_receipts(chain)
+    except Exception as e:
+        LOG.warning("head_refresh_error", chain=chain, error=e)
+    finally:
+        HEADS.end_refresh(chain)
+
+async def refresh_chain_state_async(chain: str):
+    try:
+        await asyncio.gather(refresh_balances_async([chain], force=True), poll_receipts_async(chain))
+    except Exception as e:
+        LOG.warning("head_refresh_error", chain=chain, error=e)
+    finally:
+        HEADS.end_refresh(chain)
+
+async def on_new_head_sync(chain: str, head):
+    # Синхронный режим: RPC уходят в пул потоков, поток подписок не блокируется
+    if record_new_head(chain, head):
+        asyncio.get_running_loop().run_in_executor(None, refresh_chain_state, chain)
+
+async def on_new_head_async(chain: str, head):
+    if record_new_head(chain, head):
+        asyncio.ensure_future(refresh_chain_state_async(chain))
+
+async def watch_new_heads(chain: str, on_head):
+    url = ws_url(chain)
+    backoff = 1
+    while True:
+        try:
+            async with AsyncWeb3(WebSocketProvider(url)) as w3:
+                await w3.eth.subscribe("newHeads")
+                LOG.info("ws_subscribed", chain=chain, url=url)
+                backoff = 1
+                async for message in w3.socket.process_subscriptions():
+                    await on_head(chain, message["result"])
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            HEADS.forget(chain)
+            LOG.warning("ws_disconnected", chain=chain, error=e, retry_in=backoff)
+        await asyncio.sleep(backoff)
+        backoff = min(backoff * 2, CONFIG["WS_RECONNECT_MAX_SEC"])
+
+async def _watch_all_heads(chains: list):
+    await asyncio.gather(*(watch_new_heads(chain, on_new_head_sync) for chain in chains))
+
+def start_head_watchers():
+    chains = head_chains()
+    if chains:
+        threading.Thread(target=asyncio.run, args=(_watch_all_heads(chains),), name="head-watcher", daemon=True).start()
+
+# ------------------- STARTUP ----------------------
+# Прогрев до первого ордера: все включённые сети параллельно получают chain id, nonce, баланс и fee одним
+# preflight-батчем, затем первые estimate своих маршрутов. Сеть входит в ротацию, как только прогрелась:
+# первый ордер ждёт самую быструю сеть, медленные подключаются позже, недоступные прогреваются повторно
+# с backoff. Пока прогрев не запущен (бенчмарк, импорт модуля), все сети считаются готовыми.
+
+class ChainReadiness:
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._started_at = None
+        self._ready = {}  # chain -> секунд от начала прогрева
+
+    def start(self):
+        with self._cond:
+            if self._started_at is None:
+                self._started_at = time.time()
+
+    def is_ready(self, chain: str) -> bool:
+        with self._cond:
+            return self._started_at is None or chain in self._ready
+
+    def mark_ready(self, chain: str) -> float:
+        with self._cond:
+            elapsed = time.time() - self._started_at
+            self._ready[chain] = elapsed
+            self._cond.notify_all()
+        METRICS.observe("anyarb_chain_warmup_seconds", elapsed, chain=chain)
+        ROUTE_PLANNER.invalidate()  # в план попадает новая сеть
+        return elapsed
+
+    def wait_any(self, chains, timeout: float) -> bool:
+        with self._cond:
+            return self._cond.wait_for(lambda: any(self.is_ready(c) for c in chains), timeout)
+
+READINESS = ChainReadiness()
+
+def _warm_up_routes(chain: str) -> list:
+    # Маршруты сети в порядке прогрева: первым — тот, куда по уже известным балансам пойдёт первый ордер плана
+    routes = [(chain, t) for t in CONFIG["ALLOWED_ROUTES"].get(chain, []) if t in CONFIG["ENABLED_CHAINS"]]
+    if CONFIG["ROUTE_PLANNER"]:
+        balances = balances_eth_snapshot([c for c in get_enabled_chains() if BALANCE_TRACKER.get(c) is not None])
+        step = _plan_step(balances, _planner_routes(balances), chain) if chain in balances else None
+        if step is not None:
+            routes.sort(key=lambda route: route[1] != step[0])
+    return routes
+
+def _report_ready(chain: str, elapsed: float):
+    LOG.info("chain_ready", chain=chain, elapsed_sec=elapsed, balance_wei=BALANCE_TRACKER.get(chain))
+
+def _report_warm_up_failure(chain: str, e: Exception, retry_in: float):
+    LOG.warning("warm_up_failed", chain=chain, error=e, retry_in=retry_in)
+
+def warm_up_chain(chain: str):
+    fetch_preflight(WEB3_INSTANCES[chain], chain)
+    # API estimate ограничен ESTIMATE_RPS и общий с отправкой, поэтому греем один маршрут — нужный первому
+    # ордеру сети. Остальные запросит сама отправка, когда план до них дойдёт; не ответил ни один — тоже
+    for src, dst in _warm_up_routes(chain):
+        try:
+            fetch_estimated_amount_wei(src, dst)
+            return
+        except Exception:
+            continue
+
+def _warm_up_until_ready(chain: str):
+    retry_in = 1
+    while True:
+        try:
+            warm_up_chain(chain)
+            _report_ready(chain, READINESS.mark_ready(chain))
+            return
+        except Exception as e:
+            METRICS.inc("anyarb_chain_warmup_errors_total", chain=chain)
+            _report_warm_up_failure(chain, e, retry_in)
+            time.sleep(retry_in)
+            retry_in = min(retry_in * 2, CONFIG["STARTUP_RETRY_MAX_SEC"])
+
+def warm_up() -> bool:
+    # Точка входа фазы старта: прогрев всех сетей в фоне, возврат — как только готова хотя бы одна
+    # source-сеть (True) или по STARTUP_TIMEOUT_SEC (False)
+    READINESS.start()
+    for chain in CONFIG["ENABLED_CHAINS"]:
+        if chain in WEB3_INSTANCES:
+            threading.Thread(target=_warm_up_until_ready, args=(chain,), name=f"warm-up-{chain}", daemon=True).start()
+    return READINESS.wait_any(get_configured_sources(), CONFIG["STARTUP_TIMEOUT_SEC"])
+
+async def warm_up_chain_async(session, chain: str):
+    await fetch_preflight_async(ASYNC_WEB3_INSTANCES[chain], chain)
+    for src, dst in _warm_up_routes(chain):
+        try:
+            await fetch_estimated_amount_wei_async(session, src, dst)
+            return
+        except Exception:
+            continue
+
+async def _warm_up_until_ready_async(session, chain: str):
+    retry_in = 1
+    while True:
+        try:
+            await warm_up_chain_async(session, chain)
+            _report_ready(chain, READINESS.mark_ready(chain))
+            return
+        except Exception as e:
+            METRICS.inc("anyarb_chain_warmup_errors_total", chain=chain)
+            _report_warm_up_failure(chain, e, retry_in)
+            await asyncio.sleep(retry_in)
+            retry_in = min(retry_in * 2, CONFIG["STARTUP_RETRY_MAX_SEC"])
+
+def warm_up_async(session) -> dict:
+    # chain -> задача прогрева; воркер source-сети начинает отправку, когда завершилась её задача
+    READINESS.start()
+    return {chain: asyncio.ensure_future(_warm_up_until_ready_async(session, chain))
+            for chain in CONFIG["ENABLED_CHAINS"] if chain in ASYNC_WEB3_INSTANCES}
+
+# ------------------- SCHEDULER ----------------------
+# Синхронный движок на одной куче таймеров: у каждой периодической работы — срок следующего запуска
+# (слот отправки каждой source-сети, estimate, балансы, receipts, зависшие TX, границы окон пауз).
+# Поток планировщика только отсчитывает сроки: блокирующая работа (RPC, estimate, ожидание лимитера,
+# подпись) уходит через dispatch в executor — у слота отправки свой на каждую сеть, — иначе один медленный
+# слот сдвигает все остальные сроки, включая начало паузы. Задача ставится снова через столько секунд,
+# сколько вернула (None — больше не запускать).
+
+SCHEDULER_RETRY_SEC = 5
+
+class Scheduler:
+    def __init__(self):
+        self._heap = []   # (deadline, seq, name)
+        self._tasks = {}  # name -> (seq, callback); запись в куче с другим seq устарела
+        self._seq = 0
+        self._cond = threading.Condition()  # call_at приходит и из потоков executor'ов
+
+    def call_at(self, deadline: float, name: str, callback):
+        with self._cond:
+            self._seq += 1
+            self._tasks[name] = (self._seq, callback)
+            heapq.heappush(self._heap, (deadline, self._seq, name))
+            self._cond.notify()
+
+    def call_later(self, delay: float, name: str, callback):
+        self.call_at(time.time() + delay, name, callback)
+
+    def dispatch(self, name: str, executor, fn, first_delay: float = 0):
+        # fn выполняется в executor; пока она работает, задачи нет в куче — два запуска одной задачи
+        # не пересекаются, а следующий срок отсчитывается от её завершения
+        def submit():
+            executor.submit(fn).add_done_callback(lambda future: self._dispatched_done(name, submit, future))
+        self.call_later(first_delay, name, submit)
+
+    def _dispatched_done(self, name: str, submit, future):
+        try:
+            delay = future.result()
+        except Exception as e:
+            LOG.error("task_restart", task=name, error=e, retry_in=SCHEDULER_RETRY_SEC)
+            delay = SCHEDULER_RETRY_SEC
+        if delay is not None:
+            self.call_later(delay, name, submit)
+
+    def every(self, interval: float, name: str, fn, first_delay: float = None, executor=None):
+        def run():
+            fn()
+            return interval
+        first_delay = interval if first_delay is None else first_delay
+        if executor is None:
+            self.call_later(first_delay, name, run)
+        else:
+            self.dispatch(name, executor, run, first_delay)
+
+    def _next_due(self):
+        with self._cond:
+            while True:
+                if not self._heap:
+                    self._cond.wait()
+                    continue
+                deadline, seq, name = self._heap[0]
+                task = self._tasks.get(name)
+                if task is None or task[0] != seq:
+                    heapq.heappop(self._heap)
+                    continue
+                wait_sec = deadline - time.time()
+                if wait_sec > 0:
+                    self._cond.wait(wait_sec)  # разбудит call_at с более ранним сроком
+                    continue
+                heapq.heappop(self._heap)
+                return seq, name, task[1]
+
+    def run_forever(self):
+        while True:
+            seq, name, callback = self._next_due()
+            try:
+                delay = callback()
+            except Exception as e:
+                LOG.error("task_restart", task=name, error=e, retry_in=SCHEDULER_RETRY_SEC)
+                delay = SCHEDULER_RETRY_SEC
+            with self._cond:
+                if self._tasks.get(name, (None,))[0] != seq:
+                    continue  # задачу уже перепланировали (dispatch из потока executor'а)
+                if delay is None:
+                    del self._tasks[name]
+                else:
+                    self.call_later(delay, name, callback)
 
-    target = random.choice(targets)
+# ------------------- MAIN LOOP ----------------------
 
-    print(f"\n▶️ Пробуем отправить TX: {source.upper()} → {target.upper()}")
+_send_executors = {}
 
-    success = send_remote_order_tx(WEB3_INSTANCES[source], source, target)
+def send_executor(source: str) -> ThreadPoolExecutor:
+    # Один поток на сеть: отправка и подготовка ордеров сети идут по очереди, nonce выдаются по порядку
+    if source not in _send_executors:
+        _send_executors[source] = ThreadPoolExecutor(max_workers=1, thread_name_prefix=f"send-{source}")
+    return _send_executors[source]
 
-    delay_sec = random.uniform(*CONFIG["DELAY_RANGE"])
-    if success:
-        delay_sec *= CONFIG["SUCCESS_DELAY_MULTIPLIER"]
-        success_tx_count += 1
+def send_slot(source: str, state: dict) -> float:
+    # Слот отправки сети, выполняется в send_executor(source): один ордер, затем задержка этой сети
+    if not READINESS.is_ready(source):
+        return 1
+    if balance_check_due():
+        check_balances()
+
+    # Пауза — и по state, и по самому расписанию: слот мог дойти сюда уже после её начала
+    pause = state["active_pause"] or get_current_pause(state["schedule"])
+    if pause is not None:
+        return max(0, pause["start"] + pause["duration"] - time.time())
+
+    order = PRESIGNED_ORDERS.take(source)
+    if order is not None:
+        LOG.info("order_presigned", from_chain=source, to_chain=order["to_chain"])
+        success = broadcast_order(WEB3_INSTANCES[source], order)
     else:
-        delay_sec *= CONFIG["FAILURE_DELAY_MULTIPLIER"]
+        target = select_target(source)
+        if target is None:
+            LOG.warning("no_targets", chain=source)
+            return 60
+        LOG.info("order_start", from_chain=source, to_chain=target)
+        success = send_remote_order_tx(WEB3_INSTANCES[source], source, target)
+
+    if CONFIG["PRESIGN_ORDERS_PER_CHAIN"] > 0:
+        # Следующие ордера сети готовятся во время задержки, следом в том же executor'е
+        send_executor(source).submit(presign_orders, CONFIG["PRESIGN_ORDERS_PER_CHAIN"], source)
+
+    delay_sec = next_delay_sec(success)
+    LOG.info("delay", chain=source, delay_sec=delay_sec)
+    return delay_sec
+
+def run_sync_loop(schedule):
+    if not warm_up():
+        LOG.warning("warm_up_timeout", timeout_sec=CONFIG["STARTUP_TIMEOUT_SEC"])
+    start_head_watchers()
+
+    state = {"schedule": schedule, "pause_index": 0, "active_pause": None}
+    scheduler = Scheduler()
+    now = time.time()
+    # В потоке планировщика — только быстрые задачи: окно пауз и постановка estimate в фон.
+    # Окно пауз ставится первым: на одном сроке с ним слоты отправки уже видят паузу
+    scheduler.call_at(now, "pauses", lambda: pause_window_task(state))
+    for source in get_configured_sources():
+        scheduler.dispatch(f"send:{source}", send_executor(source), lambda source=source: send_slot(source, state))
+    if CONFIG["ESTIMATE_BACKGROUND_REFRESH"]:
+        scheduler.call_at(now, "estimates", refresh_due_estimates)
+    maintenance = ThreadPoolExecutor(max_workers=3, thread_name_prefix="maintenance")
+    if CONFIG["BALANCE_REFRESH_INTERVAL_SEC"] > 0:
+        scheduler.every(CONFIG["BALANCE_REFRESH_INTERVAL_SEC"], "balances", refresh_polled_balances,
+                        executor=maintenance)
+    scheduler.every(CONFIG["RECEIPT_POLL_INTERVAL_SEC"], "receipts", poll_all_receipts, executor=maintenance)
+    if CONFIG["STUCK_CHECK_INTERVAL_SEC"] > 0:
+        scheduler.every(CONFIG["STUCK_CHECK_INTERVAL_SEC"], "stuck-tx", check_stuck_chains, executor=maintenance)
+    scheduler.run_forever()
+
+def main():
+    start_metrics()
+    restore_from_journal()
+    # Загружаем расписание пауз
+    schedule = read_pauses_schedule()
+    if should_generate_new_schedule(schedule):
+        last_big_pause = schedule["last_big_pause"] if schedule else None
+        schedule = generate_pauses_schedule(last_big_pause_ts=last_big_pause)
+
+    if CONFIG["ASYNC_MODE"]:
+        asyncio.run(run_async_engine(schedule))
+    else:
+        run_sync_loop(schedule)
 
-    print(f"🕑 Ждём {delay_sec:.1f} секунд перед следующим циклом...")
-    time.sleep(delay_sec)
+if __name__ == "__main__":
+    main()
@@ -1,7 +1,9 @@
 import os
 import random
+import threading
 import time
 import requests
+from eth_account import Account
 from web3 import Web3
 from web3.exceptions import Web3RPCError
 from decimal import Decimal
@@ -27,10 +29,30 @@ TO_ADDRESSES = {
     'unit': '0x1cEAb5967E5f078Fa0FEC3DFfD0394Af1fEeBCC9',
 }
 
+# Providers don't touch the network until the first request; all RPC work happens in warm_up()
 WEB3_INSTANCES = {name: Web3(Web3.HTTPProvider(url)) for name, url in RPCS.items()}
-w3_example = next(iter(WEB3_INSTANCES.values()))
-SENDER_ADDRESS = w3_example.eth.account.from_key(PRIVATE_KEY).address
-print(f'Sender address: {SENDER_ADDRESS}')
+SENDER_ADDRESS = Account.from_key(PRIVATE_KEY).address
+
+# ------------------- local nonces ----------------------
+# Seeded once from the pending count, then handed out locally; dropped on nonce errors.
+_nonces = {}
+
+def next_nonce(w3: Web3, chain: str) -> int:
+    if chain not in _nonces:
+        _nonces[chain] = w3.eth.get_transaction_count(SENDER_ADDRESS, 'pending')
+    nonce = _nonces[chain]
+    _nonces[chain] += 1
+    return nonce
+
+NONCE_ERRORS = ("nonce too low", "already known", "nonce too high", "replacement transaction underpriced")
+
+def reset_nonce(chain: str, err: Exception, broadcast: bool):
+    msg = str(err).lower()
+    if broadcast or any(marker in msg for marker in NONCE_ERRORS):
+        # After a failed send_raw_transaction the tx may still have reached the node: re-read the pending count
+        _nonces.pop(chain, None)
+    elif chain in _nonces:
+        _nonces[chain] -= 1  # tx never made it out, reuse the nonce
 
 
 # ------------------- encoding helpers ----------------------
@@ -81,6 +103,8 @@ def build_submit_remote_order_data(sender: str, amount_wei: int, max_reward_wei:
     )
 
 def send_remote_order_tx(w3: Web3, chain: str) -> bool:
+    nonce = None
+    broadcast = False
     try:
         to_address = TO_ADDRESSES[chain]
         sender = SENDER_ADDRESS
@@ -92,12 +116,12 @@ def send_remote_order_tx(w3: Web3, chain: str) -> bool:
         calldata = build_submit_remote_order_data(sender, estimated_amount, 10**18)
 
         # 3. Transaction setup
-        nonce = w3.eth.get_transaction_count(sender)
+        nonce = next_nonce(w3, chain)
         gas_price = w3.to_wei(1, 'gwei')
         gas_limit = 105000
 
         tx = {
-            'chainId': w3.eth.chain_id,
+            'chainId': _chain_ids[chain],
             'nonce': nonce,
             'to': to_address,
             'value': w3.to_wei(1, 'ether'),
@@ -107,6 +131,7 @@ def send_remote_order_tx(w3: Web3, chain: str) -> bool:
         }
 
         signed_tx = w3.eth.account.sign_transaction(tx, private_key=PRIVATE_KEY)
+        broadcast = True
         tx_hash = w3.eth.send_raw_transaction(signed_tx.raw_transaction)
 
         print(f"✅ [{chain.upper()}] TX sent: {w3.to_hex(tx_hash)}")
@@ -114,28 +139,71 @@ def send_remote_order_tx(w3: Web3, chain: str) -> bool:
 
     except Exception as e:
         print(f"❌ [{chain.upper()}] TX failed: {e}")
+        if nonce is not None:
+            reset_nonce(chain, e, broadcast)
         return False
 
-# ------------------- main loop ----------------------
+# ------------------- startup ----------------------
+# Every chain is warmed up in its own thread (chain id, nonce, balance). A chain starts receiving
+# orders as soon as it is ready, so the first order waits for the fastest chain only.
+_chain_ids = {}
+_ready_chains = set()
+_ready_event = threading.Event()
 
-while True:
-    chain = random.choice(list(RPCS.keys()))
+def warm_up_chain(chain: str):
     w3 = WEB3_INSTANCES[chain]
+    retry_in = 1
+    while True:
+        try:
+            started = time.time()
+            _chain_ids[chain] = w3.eth.chain_id
+            _nonces.setdefault(chain, w3.eth.get_transaction_count(SENDER_ADDRESS, 'pending'))
+            balance = w3.from_wei(w3.eth.get_balance(SENDER_ADDRESS), 'ether')
+            _ready_chains.add(chain)
+            _ready_event.set()
+            print(f"🟢 [{chain.upper()}] ready in {time.time() - started:.2f}s, balance {balance:.4f} ETH")
+            return
+        except Exception as e:
+            print(f"⚠️ [{chain.upper()}] warm-up failed: {e}. Retrying in {retry_in}s")
+            time.sleep(retry_in)
+            retry_in = min(retry_in * 2, 60)
+
+def warm_up(timeout: float = 60) -> bool:
+    for chain in RPCS:
+        threading.Thread(target=warm_up_chain, args=(chain,), name=f"warm-up-{chain}", daemon=True).start()
+    return _ready_event.wait(timeout)
 
-    success = send_remote_order_tx(w3, chain)
+# ------------------- main loop ----------------------
 
-    if not success:
-        all_low = True
-        for c, w in WEB3_INSTANCES.items():
-            bal = w.eth.get_balance(SENDER_ADDRESS)
-            if w.from_wei(bal, 'ether') > 1:
-                all_low = False
+def main():
+    print(f'Sender address: {SENDER_ADDRESS}')
+    if not warm_up():
+        print("⏳ No chain is ready yet, waiting...")
+        _ready_event.wait()
+
+    while True:
+        # Chains that are still warming up join the rotation once ready
+        chain = random.choice(sorted(_ready_chains))
+        w3 = WEB3_INSTANCES[chain]
+
+        success = send_remote_order_tx(w3, chain)
+
+        if not success:
+            all_low = True
+            for c in sorted(_ready_chains):
+                w = WEB3_INSTANCES[c]
+                bal = w.eth.get_balance(SENDER_ADDRESS)
+                if w.from_wei(bal, 'ether') > 1:
+                    all_low = False
+                    break
+
+            if all_low:
+                print("❌ All balances low. Exiting.")
                 break
 
-        if all_low:
-            print("❌ All balances low. Exiting.")
-            break
+        sleep_time = random.randint(1, 5)
+        print(f"⏳ Sleeping {sleep_time} sec...")
+        time.sleep(sleep_time)
 
-    sleep_time = random.randint(1, 5)
-    print(f"⏳ Sleeping {sleep_time} sec...")
-    time.sleep(sleep_time)
+if __name__ == "__main__":
+    main()